@@ -0,0 +1,8 @@
+import kicktipper
+
+# Precomputes the predicted scores and tendency probabilities for all projected scores 0.00 ... 5.00
+table = kicktipper.PredictionTable(path='../data/prediction_table', l_max=5.0, step=0.01, n_bins=8)
+table.build()
+
+# The table is memory-mapped and used by the tipper for all projected scores on the grid
+tipper = kicktipper.TipperBundesliga('name', prediction_table=table.load())
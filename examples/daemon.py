@@ -0,0 +1,22 @@
+import logging
+from datetime import timedelta
+
+import kicktipper
+
+GROUP_NAME = 'name'
+USERNAME = None  # if None, the user if prompted for input
+PASSWORD = None  # if None, the user if prompted for input
+LEAD_TIME = timedelta(minutes=10)  # predictions are submitted this long before each kickoff
+
+logging.basicConfig(level=logging.INFO)
+
+tipper = kicktipper.TipperBundesliga(GROUP_NAME)
+tipper.kicktipp_username = USERNAME
+tipper.kicktipp_password = PASSWORD
+tipper.login()
+
+daemon = kicktipper.TipperDaemon(tipper, lead_time=LEAD_TIME)
+try:
+    daemon.run()  # runs until interrupted (Ctrl+C)
+finally:
+    tipper.logout()
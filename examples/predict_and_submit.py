@@ -9,7 +9,7 @@ UPDATE_FTE = False  # if True, projected scores are updated from five-thirty-eig
 tipper = kicktipper.TipperBundesliga(GROUP_NAME)
 tipper.kicktipp_username = USERNAME
 tipper.kicktipp_password = PASSWORD
-tipper.login()
+tipper.login()  # reuses the session of the previous run if it is still logged in
 
 if UPDATE_FTE:
     tipper.projected_scores_update()
@@ -17,4 +17,6 @@ if UPDATE_FTE:
 tipper.predict_and_submit_scores_for_matchday(MATCHDAY)
 tipper.store_data_for_matchday_to_file(MATCHDAY)
 
-tipper.logout()
+# tipper.logout() is not called, so the saved session can be reused by the next run
+
+print(tipper.instrumentation.summary())  # wall time, HTTP requests and rows of each stage
@@ -2,3 +2,15 @@ from .kicktipp_api import *
 from .predictor import *
 from .fivethirtyeight import *
 from .tipper_bundesliga import *
+from .backtest import *
+from .sweep import *
+from .store import *
+from .archive import *
+from .dixoncoles import *
+from .ratings import *
+from .odds import *
+from .blend import *
+from .instrumentation import *
+from .daemon import *
+from .lookup import *
+from .report import *
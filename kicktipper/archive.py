@@ -0,0 +1,200 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import json
+import os
+import uuid
+from datetime import datetime
+
+
+class SnapshotArchive:
+    """ Append-only archive of matchday snapshots (matches, points, odds, projected and predicted scores).
+
+    The snapshots are stored as Parquet files with a typed schema (see SCHEMA), partitioned by season and matchday:
+    <path>/season=<season>/matchday=<matchday>/<file>.parquet
+    Each call of append adds a new file, existing files are never modified. compact merges the files of a partition.
+    A compacted file lists the files it replaces in its metadata; read skips these files, so reads during compaction
+    see each snapshot exactly once.
+
+    Reading memory-maps the files and pushes filters down to the partitions and row groups, so e.g. all snapshots of
+    one fixture over several seasons are read without loading the rest of the archive.
+    """
+
+    SCHEMA = pa.schema([
+        ('timestamp', pa.timestamp('s')),
+        ('team1', pa.dictionary(pa.int16(), pa.string())),
+        ('team2', pa.dictionary(pa.int16(), pa.string())),
+        ('points_win1', pa.int16()),
+        ('points_draw', pa.int16()),
+        ('points_win2', pa.int16()),
+        ('odds_win1', pa.float32()),
+        ('odds_draw', pa.float32()),
+        ('odds_win2', pa.float32()),
+        ('proj_score1', pa.float32()),
+        ('proj_score2', pa.float32()),
+        ('pred_score1', pa.int8()),
+        ('pred_score2', pa.int8()),
+    ])
+    PARTITIONING = pa.schema([('season', pa.int16()), ('matchday', pa.int8())])
+    COMPACTED_FROM = b'kicktipper.compacted_from'  # metadata key of compacted files: JSON list of replaced files
+
+    def __init__(self, path='../data/archive'):
+        """
+
+        Parameters
+        ----------
+        path : str
+            Root directory of the archive
+        """
+        self.path = path
+
+    def _partition_files(self, directory):
+        """ Returns the data files of a partition directory and the files replaced by a compacted file (left over if
+        a compaction was interrupted before the replaced files were removed). Hidden files ('.' or '_' prefix, e.g. the
+        temporary files of compact) are ignored.
+        """
+        files = sorted(f for f in os.listdir(directory) if f.endswith('.parquet') and not f.startswith(('.', '_')))
+        replaced = set()
+        for f in files:
+            if f.startswith('compacted-'):
+                metadata = pq.read_schema(os.path.join(directory, f)).metadata or {}
+                replaced.update(json.loads(metadata.get(self.COMPACTED_FROM, b'[]')))
+        return [f for f in files if f not in replaced], sorted(replaced.intersection(files))
+
+    def _files(self):
+        """ Returns the paths of all current data files of the archive, see _partition_files """
+        paths = []
+        for root, directories, _ in os.walk(self.path):
+            directories[:] = sorted(d for d in directories if not d.startswith(('.', '_')))
+            paths.extend(os.path.join(root, f) for f in self._partition_files(root)[0])
+        return paths
+
+    def _partition_dir(self, season, matchday):
+        return os.path.join(self.path, 'season=' + str(int(season)), 'matchday=' + str(int(matchday)))
+
+    def _to_table(self, df):
+        df = df.reindex(columns=self.SCHEMA.names)
+        df['timestamp'] = pd.to_datetime(df['timestamp']).dt.floor('s')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        return table.cast(self.SCHEMA)
+
+    def append(self, df, season, timestamp=None):
+        """ Appends a snapshot.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Snapshot with a column 'matchday' and the columns from SCHEMA (missing columns are stored as nulls), e.g.
+            the data written by TipperBundesliga.store_data_for_matchday_to_file
+        season : int
+            Season (year in which the season started)
+        timestamp : str or datetime.datetime, optional
+            Timestamp of the snapshot, used if df has no column 'timestamp'. If None (default), the current time is
+            used.
+        """
+        df = df.copy()
+        if 'timestamp' not in df:
+            df['timestamp'] = timestamp if timestamp is not None else datetime.now()
+
+        for matchday, df_matchday in df.groupby('matchday'):
+            directory = self._partition_dir(season, matchday)
+            if not os.path.isdir(directory):  # create directory if it does not exist
+                os.makedirs(directory)
+            filename = os.path.join(directory, datetime.now().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex
+                                    + '.parquet')
+            pq.write_table(self._to_table(df_matchday), filename)
+
+    def read(self, columns=None, filters=None):
+        """ Reads snapshots from the archive.
+
+        Parameters
+        ----------
+        columns : list of str, optional
+            Columns to read (including the partition columns 'season' and 'matchday'). If None (default), all
+            columns are read.
+        filters : list or pyarrow.compute.Expression, optional
+            Filters in the format of pyarrow.parquet.read_table, e.g. [('season', '>=', 2018), ('team1', '=', 'SC
+            Freiburg')]. Filters on 'season' and 'matchday' skip whole partitions.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        files = self._files() if os.path.isdir(self.path) else []
+        if not files:
+            return pd.DataFrame(columns=self.PARTITIONING.names + self.SCHEMA.names)
+
+        if isinstance(filters, list):
+            filters = pq.filters_to_expression(filters)
+        dataset = ds.dataset(files, schema=pa.unify_schemas([self.SCHEMA, self.PARTITIONING]), format='parquet',
+                             filesystem=pafs.LocalFileSystem(use_mmap=True), partition_base_dir=self.path,
+                             partitioning=ds.partitioning(self.PARTITIONING, flavor='hive'))
+        return dataset.to_table(columns=columns, filter=filters).to_pandas()
+
+    def snapshots_of_fixture(self, team1, team2, season=None, columns=None):
+        """ Returns all snapshots of a fixture.
+
+        Parameters
+        ----------
+        team1 : str
+        team2 : str
+        season : int, optional
+            If None (default), the snapshots from all seasons are returned.
+        columns : list of str, optional
+            See read
+
+        Returns
+        -------
+        pandas.DataFrame
+            Sorted by timestamp
+        """
+        filters = [('team1', '=', team1), ('team2', '=', team2)]
+        if season is not None:
+            filters.append(('season', '=', season))
+        df = self.read(columns=columns, filters=filters)
+        if 'timestamp' in df:
+            df = df.sort_values('timestamp', ignore_index=True)
+        return df
+
+    def compact(self, season=None):
+        """ Merges the files of each partition into a single file, sorted by timestamp.
+
+        Parameters
+        ----------
+        season : int, optional
+            Season to compact. If None (default), all seasons are compacted.
+        """
+        if not os.path.isdir(self.path):
+            return
+        seasons = [season] if season is not None else \
+            [int(d.split('=')[1]) for d in os.listdir(self.path) if d.startswith('season=')]
+
+        for s in seasons:
+            season_dir = os.path.join(self.path, 'season=' + str(s))
+            if not os.path.isdir(season_dir):
+                continue
+            for d in os.listdir(season_dir):
+                directory = os.path.join(season_dir, d)
+                if d.startswith(('.', '_')) or not os.path.isdir(directory):
+                    continue
+                files, replaced = self._partition_files(directory)
+                for f in replaced:  # left over by an interrupted compaction
+                    os.remove(os.path.join(directory, f))
+                if len(files) < 2:
+                    continue
+
+                tables = [pq.read_table(os.path.join(directory, f), memory_map=True) for f in files]
+                table = pa.concat_tables(tables, promote_options='permissive').cast(self.SCHEMA)
+                table = table.sort_by('timestamp')
+                table = table.replace_schema_metadata({self.COMPACTED_FROM: json.dumps(files).encode()})
+
+                # The temporary file is hidden ('.' prefix), so read ignores it while it is written. Between the rename
+                # and the removal of the replaced files, read skips the replaced files (see _partition_files), so the
+                # partition is neither incomplete nor duplicated.
+                name = 'compacted-' + uuid.uuid4().hex + '.parquet'
+                pq.write_table(table, os.path.join(directory, '.' + name + '.tmp'))
+                os.replace(os.path.join(directory, '.' + name + '.tmp'), os.path.join(directory, name))
+                for f in files:
+                    os.remove(os.path.join(directory, f))
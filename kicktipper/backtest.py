@@ -0,0 +1,334 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from . import fivethirtyeight
+from . import predictor
+
+
+def kicktipp_points(tips, results, points=(4, 3, 2)):
+    """ Calculates the points awarded by kicktipp for tipps.
+
+    A correct score gets points[0], a correct goal difference points[1] and a correct tendency points[2]. As on
+    kicktipp, there are no points for the goal difference of a draw, i.e. a wrong draw tipp gets points for the
+    tendency only.
+
+    Parameters
+    ----------
+    tips : array_like
+        Tipped scores, last axis with two elements (goals team 1, goals team 2)
+    results : array_like
+        Final scores, last axis with two elements. Must be broadcastable to tips.
+    points : tuple
+        Points for (correct score, correct goal difference, correct tendency). Default: (4, 3, 2)
+
+    Returns
+    -------
+    nd.array
+        Points for each tipp
+    """
+    tips = np.asarray(tips)
+    results = np.asarray(results)
+    d_tip = tips[..., 0] - tips[..., 1]
+    d_result = results[..., 0] - results[..., 1]
+
+    exact = (tips[..., 0] == results[..., 0]) & (tips[..., 1] == results[..., 1])
+    difference = (d_tip == d_result) & (d_result != 0)
+    tendency = np.sign(d_tip) == np.sign(d_result)
+
+    return np.select([exact, difference, tendency], points, default=0)
+
+
+def points_matrix(n_bins, points=(4, 3, 2)):
+    """ Returns the kicktipp points for all combinations of tipps and results up to n_bins-1 goals per team.
+
+    Parameters
+    ----------
+    n_bins : int
+        Number of goals considered per team (0 ... n_bins-1)
+    points : tuple
+        See kicktipp_points
+
+    Returns
+    -------
+    nd.array
+        Matrix with shape (n_bins**2, n_bins**2). Element [t, r] are the points for the tipp with the flattened index t
+        if the result has the flattened index r (flattened as in numpy.ravel_multi_index).
+    """
+    scores = np.stack(np.unravel_index(np.arange(n_bins**2), (n_bins, n_bins)), axis=1)
+    return kicktipp_points(scores[:, np.newaxis, :], scores[np.newaxis, :, :], points)
+
+
+def calibration_metrics(probs_tendency, results):
+    """ Calculates calibration metrics of the predicted tendencies for each match.
+
+    Parameters
+    ----------
+    probs_tendency : nd.array
+        Probabilities with shape (number of matches, 3) in the order of MatchPredictor.probs_tendency:
+        [team 1 wins, team 2 wins, draw]. The probabilities are normalized before calculating the metrics.
+    results : nd.array
+        Final scores with shape (number of matches, 2)
+
+    Returns
+    -------
+    dict
+        Arrays with the Brier score ('brier'), the ranked probability score ('rps') and the logarithmic loss
+        ('log_loss') of each match
+    """
+    probs = probs_tendency / np.sum(probs_tendency, axis=1, keepdims=True)
+    d = results[:, 0] - results[:, 1]
+    outcome = np.select([d > 0, d < 0], [0, 1], default=2)
+    observed = np.eye(3)[outcome]
+
+    brier = np.sum((probs - observed)**2, axis=1)
+
+    # The RPS requires the ordered outcomes: team 1 wins, draw, team 2 wins
+    order = [0, 2, 1]
+    cum_probs = np.cumsum(probs[:, order], axis=1)[:, :-1]
+    cum_observed = np.cumsum(observed[:, order], axis=1)[:, :-1]
+    rps = np.sum((cum_probs - cum_observed)**2, axis=1) / 2
+
+    p_outcome = probs[np.arange(len(outcome)), outcome]
+    log_loss = -np.log(np.clip(p_outcome, 1e-15, None))
+
+    return {'brier': brier, 'rps': rps, 'log_loss': log_loss}
+
+
+def strategy_predicted_score(score_probs, points=(4, 3, 2), tie_break='team1'):
+    """ Tipps the score from MatchPredictor.predicted_score (tie_break: see MatchPredictor.tie_break) """
+    return predictor.MatchPredictor.predicted_score_batch(score_probs, tie_break)[0]
+
+
+def strategy_most_likely_score(score_probs, points=(4, 3, 2), tie_break=None):
+    """ Tipps the single most likely score (tie_break is not used) """
+    n_matches, n_bins = score_probs.shape[0], score_probs.shape[-1]
+    idx = np.argmax(score_probs.reshape(n_matches, -1), axis=1)
+    return np.stack(np.unravel_index(idx, (n_bins, n_bins)), axis=1)
+
+
+def strategy_expected_points(score_probs, points=(4, 3, 2), tie_break=None):
+    """ Tipps the score with the highest expected number of kicktipp points (tie_break is not used) """
+    n_matches, n_bins = score_probs.shape[0], score_probs.shape[-1]
+    expected_points = score_probs.reshape(n_matches, -1) @ points_matrix(n_bins, points).T
+    idx = np.argmax(expected_points, axis=1)
+    return np.stack(np.unravel_index(idx, (n_bins, n_bins)), axis=1)
+
+
+STRATEGIES = {
+    'predicted_score': strategy_predicted_score,
+    'most_likely_score': strategy_most_likely_score,
+    'expected_points': strategy_expected_points,
+}
+
+
+def apply_draw_bias(score_probs, draw_bias):
+    """ Scales the probabilities of all draws by (1 + draw_bias) and renormalizes the score probabilities.
+
+    Parameters
+    ----------
+    score_probs : nd.array
+        Score probabilities with shape (number of matches, n_bins, n_bins)
+    draw_bias : float
+        Relative change of the draw probabilities, e.g. 0.1 makes draws 10 % more likely (before renormalization)
+
+    Returns
+    -------
+    nd.array
+        Adjusted score probabilities. The total probability of each match is unchanged.
+    """
+    if draw_bias == 0:
+        return score_probs
+    n_bins = score_probs.shape[-1]
+    scale = 1 + draw_bias*np.eye(n_bins)
+    total = np.sum(score_probs, axis=(1, 2), keepdims=True)
+    biased = score_probs*scale
+    return biased * total / np.sum(biased, axis=(1, 2), keepdims=True)
+
+
+def evaluate_tips(score_probs, results, strategy='predicted_score', points=(4, 3, 2), tie_break=None):
+    """ Applies a strategy to score probabilities and evaluates the tipps against the final scores.
+
+    Parameters
+    ----------
+    score_probs : nd.array
+        Score probabilities with shape (number of matches, n_bins, n_bins)
+    results : nd.array
+        Final scores with shape (number of matches, 2)
+    strategy : str or callable
+        See Backtest
+    points : tuple
+        See kicktipp_points
+    tie_break : str, optional
+        Passed to the strategy if given, see MatchPredictor.tie_break. Custom strategies without this parameter can
+        only be used with tie_break None (default).
+
+    Returns
+    -------
+    dict
+        Arrays with one element per match: 'tips' (shape (number of matches, 2)), 'probs_tendency' (shape (number of
+        matches, 3)), 'points' and the metrics from calibration_metrics
+    """
+    if isinstance(strategy, str):
+        strategy = STRATEGIES[strategy]
+
+    tips = strategy(score_probs, points) if tie_break is None else strategy(score_probs, points, tie_break=tie_break)
+    probs_tendency = predictor.MatchPredictor.probs_tendency_batch(score_probs)
+
+    evaluation = {'tips': tips, 'probs_tendency': probs_tendency, 'points': kicktipp_points(tips, results, points)}
+    evaluation.update(calibration_metrics(probs_tendency, results))
+    return evaluation
+
+
+def _backtest_matches(data, strategy, n_bins, points, lambda_scale, draw_bias, tie_break=None):
+    """ Applies a strategy to the projected scores of the matches in data and evaluates the tipps.
+
+    Module level function, so it can be sent to the worker processes of Backtest.run.
+    """
+    pred = predictor.MatchPredictor()
+    # computed in float64, also for compact (float32) data
+    score_probs = pred.calculate_score_probs_batch(lambda_scale*data['proj_score1'].values.astype(float),
+                                                   lambda_scale*data['proj_score2'].values.astype(float), n_bins)
+    score_probs = apply_draw_bias(score_probs, draw_bias)
+    results = data[['score1', 'score2']].values.astype(int)
+    evaluation = evaluate_tips(score_probs, results, strategy, points, tie_break)
+
+    df = data[['league_id', 'league', 'season', 'date', 'team1', 'team2',
+               'proj_score1', 'proj_score2', 'score1', 'score2']].copy()
+    df['tipp1'] = evaluation['tips'][:, 0]
+    df['tipp2'] = evaluation['tips'][:, 1]
+    df['points'] = evaluation['points']
+    df['prob1'] = evaluation['probs_tendency'][:, 0]
+    df['prob2'] = evaluation['probs_tendency'][:, 1]
+    df['prob_draw'] = evaluation['probs_tendency'][:, 2]
+    for metric in ('brier', 'rps', 'log_loss'):
+        df[metric] = evaluation[metric]
+
+    return df
+
+
+class Backtest:
+    """ Replays historical FiveThirtyEight projections and evaluates a tipp strategy against the final scores.
+
+    Attributes
+    ----------
+    data : pandas.DataFrame
+        Historical matches (FiveThirtyEight format) including projected and final scores
+    strategy : str or callable
+        Name of a strategy from STRATEGIES, or a function mapping score probabilities with shape
+        (number of matches, n_bins, n_bins) and the points tuple to tipps with shape (number of matches, 2)
+    n_bins : int
+        Number of bins of the Poisson distributions, see MatchPredictor
+    points : tuple
+        Points for (correct score, correct goal difference, correct tendency)
+    lambda_scale : float
+        Factor applied to the projected scores before calculating the score probabilities
+    draw_bias : float
+        See apply_draw_bias
+    tie_break : str
+        See MatchPredictor.tie_break. If None (default), the strategy's default is used.
+    matches : pandas.DataFrame
+        Tipps, points and metrics of each match of the last run
+    """
+
+    def __init__(self, data=None, strategy='predicted_score', n_bins=8, points=(4, 3, 2), lambda_scale=1.0,
+                 draw_bias=0.0, tie_break=None):
+        """
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Historical matches. If None (default), all leagues and seasons are read from the FiveThirtyEight data file
+            (in the compact format, see FiveThirtyEight.compact).
+        """
+        if data is None:
+            fte = fivethirtyeight.FiveThirtyEight()
+            fte.read_data(league_id=None, min_date=None, compact=True)
+            data = fte.data
+
+        # Only matches with projections and final scores can be evaluated
+        self.data = data.dropna(subset=['proj_score1', 'proj_score2', 'score1', 'score2'])
+        self.strategy = strategy
+        self.n_bins = n_bins
+        self.points = points
+        self.lambda_scale = lambda_scale
+        self.draw_bias = draw_bias
+        self.tie_break = tie_break
+        self.matches = pd.DataFrame()
+
+    def select(self, leagues=None, seasons=None):
+        """ Returns the matches of the given leagues and seasons.
+
+        Parameters
+        ----------
+        leagues : list
+            League IDs (int) or league names (str). If None (default), all leagues are selected.
+        seasons : list
+            Seasons (year in which the season started, e.g. 2019 for 2019/20). If None (default), all seasons are
+            selected.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        data = self.data
+        if leagues is not None:
+            leagues = list(leagues)
+            data = data[data['league_id'].isin(leagues) | data['league'].isin(leagues)]
+        if seasons is not None:
+            data = data[data['season'].isin(list(seasons))]
+        return data
+
+    def run(self, leagues=None, seasons=None, n_workers=None):
+        """ Runs the backtest. Every league and season is evaluated in a separate worker process.
+
+        Parameters
+        ----------
+        leagues : list
+            See select
+        seasons : list
+            See select
+        n_workers : int
+            Number of worker processes. If None (default), the number of processors is used. If 1, the backtest
+            runs in the current process.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Summary for each league and season, see summarize
+        """
+        groups = [group for _, group in self.select(leagues, seasons).groupby(['league_id', 'season'])]
+        args = [[value]*len(groups) for value in (self.strategy, self.n_bins, self.points, self.lambda_scale,
+                                                  self.draw_bias, self.tie_break)]
+
+        if n_workers == 1:
+            results = list(map(_backtest_matches, groups, *args))
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(_backtest_matches, groups, *args))
+
+        self.matches = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+        return self.summarize()
+
+    def summarize(self, by=('league', 'season')):
+        """ Summarizes the results of the last run.
+
+        Parameters
+        ----------
+        by : tuple
+            Columns of self.matches to group by. If empty, the summary of all matches is returned.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Number of matches, total points, points per match and mean calibration metrics
+        """
+        if self.matches.empty:  # no league or season selected
+            columns = ['matches', 'points', 'points_per_match', 'brier', 'rps', 'log_loss']
+            index = pd.MultiIndex.from_arrays([[]]*len(by), names=list(by)) if len(by) > 1 else \
+                pd.Index([], name=by[0] if by else '_all')
+            return pd.DataFrame(columns=columns, index=index)
+        matches = self.matches.assign(_all='all')
+        grouped = matches.groupby(list(by) if by else '_all')
+        return grouped.agg(matches=('points', 'size'), points=('points', 'sum'), points_per_match=('points', 'mean'),
+                           brier=('brier', 'mean'), rps=('rps', 'mean'), log_loss=('log_loss', 'mean'))
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+from scipy import optimize
+
+from . import backtest
+from . import predictor
+
+
+class LambdaBlender:
+    """ Combines the projected scores of several sources (e.g. FiveThirtyEight, bookmaker's odds, DixonColes,
+    PoissonRatings) with weights learned from historical results.
+
+    Sources are passed as dict: name => (l1, l2), where l1 and l2 are arrays aligned by match (see align). Missing
+    projections are NaN; for each match the weights of the available sources are renormalized.
+
+    Two modes are supported:
+
+    * 'lambda': the projected scores are averaged, the result can be passed to MatchPredictor.
+    * 'matrix': the score probabilities of the sources are averaged (mixture of the distributions).
+
+    The weights minimize the log-loss of the predicted tendencies (see backtest.calibration_metrics).
+
+    Attributes
+    ----------
+    mode : str
+    n_bins : int
+        Number of bins of the Poisson distributions, see MatchPredictor
+    weights : dict
+        Weight of each source (sum 1)
+    """
+
+    def __init__(self, mode='lambda', n_bins=8):
+        if mode not in ('lambda', 'matrix'):
+            raise(ValueError('Invalid value for "mode".'))
+        self.mode = mode
+        self.n_bins = n_bins
+        self.weights = {}
+
+        self._pred = predictor.MatchPredictor()
+
+    @staticmethod
+    def align(fixtures, sources):
+        """ Aligns projected scores from several DataFrames with a list of fixtures.
+
+        Parameters
+        ----------
+        fixtures : pandas.DataFrame
+            Matches with columns 'team1' and 'team2'
+        sources : dict
+            name => DataFrame with columns 'team1', 'team2', 'proj_score1', 'proj_score2'
+
+        Returns
+        -------
+        dict
+            name => (l1, l2), arrays aligned with fixtures (NaN where a source has no projection)
+        """
+        aligned = {}
+        keys = fixtures[['team1', 'team2']]
+        for name, df in sources.items():
+            df = keys.merge(df[['team1', 'team2', 'proj_score1', 'proj_score2']].drop_duplicates(['team1', 'team2']),
+                            on=['team1', 'team2'], how='left')
+            aligned[name] = (df['proj_score1'].values.astype(float), df['proj_score2'].values.astype(float))
+        return aligned
+
+    def _weight_matrix(self, sources, weights):
+        """ Weights per match and source (rows: matches), zero for missing sources and renormalized """
+        available = np.stack([~(np.isnan(l1) | np.isnan(l2)) for l1, l2 in sources.values()], axis=1)
+        w = available*np.asarray(weights)
+        total = np.sum(w, axis=1, keepdims=True)
+        return np.divide(w, total, out=np.zeros_like(w), where=total > 0)
+
+    def _blend(self, sources, weights):
+        w = self._weight_matrix(sources, weights)
+        l1 = np.stack([np.nan_to_num(l1) for l1, _ in sources.values()], axis=1)
+        l2 = np.stack([np.nan_to_num(l2) for _, l2 in sources.values()], axis=1)
+        missing = np.sum(w, axis=1) == 0
+
+        if self.mode == 'lambda':
+            blended1 = np.where(missing, np.nan, np.sum(w*l1, axis=1))
+            blended2 = np.where(missing, np.nan, np.sum(w*l2, axis=1))
+            return blended1, blended2
+        else:
+            score_probs = self._pred.calculate_score_probs_batch(l1.ravel(), l2.ravel(), self.n_bins)
+            score_probs = score_probs.reshape(l1.shape + score_probs.shape[1:])
+            return np.einsum('ns,nsij->nij', w, score_probs)
+
+    def _source_weights(self, sources):
+        return [self.weights.get(name, 0.0) for name in sources]
+
+    def blend_lambdas(self, sources):
+        """ Returns the blended projected scores (l1, l2). Only available in mode 'lambda'. """
+        if self.mode != 'lambda':
+            raise(ValueError('Projected scores can only be blended in mode "lambda".'))
+        return self._blend(sources, self._source_weights(sources))
+
+    def blend_score_probs(self, sources):
+        """ Returns the blended score probabilities with shape (number of matches, n_bins, n_bins) """
+        if self.mode == 'lambda':
+            l1, l2 = self._blend(sources, self._source_weights(sources))
+            return self._pred.calculate_score_probs_batch(np.nan_to_num(l1), np.nan_to_num(l2), self.n_bins)
+        return self._blend(sources, self._source_weights(sources))
+
+    def fit(self, sources, results):
+        """ Learns the weights from historical projections and results.
+
+        Parameters
+        ----------
+        sources : dict
+            name => (l1, l2), aligned arrays of historical projections
+        results : array_like
+            Final scores with shape (number of matches, 2)
+
+        Returns
+        -------
+        LambdaBlender
+            self
+        """
+        names = list(sources)
+        # only matches with at least one projection are used
+        evaluate = np.any(self._weight_matrix(sources, np.ones(len(names))) > 0, axis=1)
+        sources = {name: (l1[evaluate], l2[evaluate]) for name, (l1, l2) in sources.items()}
+        results = np.asarray(results)[evaluate]
+
+        if self.mode == 'matrix':
+            # The tendency probabilities of a mixture are the mixture of the tendency probabilities, so they are
+            # calculated only once per source.
+            probs = np.stack([self._pred.probs_tendency_batch(
+                self._pred.calculate_score_probs_batch(np.nan_to_num(l1), np.nan_to_num(l2), self.n_bins))
+                for l1, l2 in sources.values()], axis=1)
+
+            def tendency(weights):
+                return np.einsum('ns,nso->no', self._weight_matrix(sources, weights), probs)
+        else:
+            def tendency(weights):
+                l1, l2 = self._blend(sources, weights)
+                return self._pred.probs_tendency_batch(self._pred.calculate_score_probs_batch(l1, l2, self.n_bins))
+
+        def loss(params):
+            weights = np.exp(params - np.max(params))  # softmax parametrization: positive weights
+            return np.mean(backtest.calibration_metrics(tendency(weights/np.sum(weights)), results)['log_loss'])
+
+        result = optimize.minimize(loss, np.zeros(len(names)), method='Nelder-Mead',
+                                   options={'xatol': 1e-3, 'fatol': 1e-7})
+        weights = np.exp(result.x - np.max(result.x))
+        self.weights = dict(zip(names, (weights/np.sum(weights)).tolist()))
+
+        return self
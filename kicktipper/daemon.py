@@ -0,0 +1,159 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def parse_kickoff(date):
+    """ Parses the kickoff time of a match as shown on the kicktipp website, e.g. '18.10.19 20:30'
+
+    Parameters
+    ----------
+    date : str
+
+    Returns
+    -------
+    datetime.datetime
+        Kickoff time, None if date cannot be parsed
+    """
+    try:
+        return datetime.strptime(str(date).strip(), '%d.%m.%y %H:%M')
+    except ValueError:
+        return None
+
+
+class TipperDaemon:
+    """ Long-running service which submits the predictions for each match shortly before it locks.
+
+    The daemon keeps the logged-in session of a TipperBundesliga object. For the upcoming matchday, the kickoff times
+    are read from the kicktipp website and matches with the same kickoff are grouped. lead_time before each kickoff
+    group, the projected scores are updated (if older than projection_max_age) and the predictions for all open
+    matches of the matchday are submitted. So a matchday costs one page fetch and one submission per kickoff group
+    plus the updates of the projected scores.
+
+    Attributes
+    ----------
+    tipper : TipperBundesliga
+        Logged in tipper
+    lead_time : datetime.timedelta
+        Time before the kickoff at which the predictions are submitted
+    projection_max_age : datetime.timedelta
+        Maximum age of the projected scores before they are downloaded again
+    replan_interval : datetime.timedelta
+        Time to wait before reading the schedule again, when no match of the upcoming matchday is open anymore
+    metrics_file : str, optional
+        If given, the instrumentation records of each submission are appended to this file as JSON lines (see
+        Instrumentation.write_json). The records are reset after each submission in any case.
+    """
+
+    def __init__(self, tipper, lead_time=timedelta(minutes=10), projection_max_age=timedelta(hours=2),
+                 replan_interval=timedelta(hours=6), metrics_file=None):
+        self.tipper = tipper
+        self.lead_time = lead_time
+        self.projection_max_age = projection_max_age
+        self.replan_interval = replan_interval
+        self.metrics_file = metrics_file
+
+        self._projections_updated = None
+        self._submitted = set()  # kickoff times of the groups already submitted
+        self._stop = threading.Event()
+
+    def schedule(self, now=None):
+        """ Returns the submission times of the upcoming matchday.
+
+        Parameters
+        ----------
+        now : datetime.datetime, optional
+            Current time. If None (default), datetime.now() is used.
+
+        Returns
+        -------
+        list of tuple
+            Sorted pairs (submission time, kickoff time), one per kickoff group which has not started yet and has not
+            been submitted yet. Submission times already passed are replaced by now.
+        """
+        if now is None:
+            now = datetime.now()
+        games = self.tipper.kicktipp_matches_read(align_team_names=False)
+        kickoffs = sorted({kickoff for kickoff in games['date'].map(parse_kickoff)
+                           if kickoff is not None and kickoff > now and kickoff not in self._submitted})
+        return [(max(kickoff - self.lead_time, now), kickoff) for kickoff in kickoffs]
+
+    def submit(self):
+        """ Updates the projected scores if necessary and submits the predictions for the upcoming matchday """
+        now = datetime.now()
+        if self._projections_updated is None or now - self._projections_updated > self.projection_max_age:
+            logger.info('Updating projected scores')
+            self.tipper.projected_scores_update()
+            self._projections_updated = now
+
+        logger.info('Submitting predictions')
+        try:
+            self.tipper.predict_and_submit_scores_for_matchday()
+        finally:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        """ Appends the instrumentation records to metrics_file (if set) and resets them """
+        instrumentation = self.tipper.instrumentation
+        if instrumentation is None:
+            return
+        if self.metrics_file is not None and len(instrumentation.records):
+            try:
+                instrumentation.write_json(self.metrics_file)
+            except OSError:
+                logger.exception('Writing the metrics failed')
+        instrumentation.reset()
+
+    def login(self):
+        """ Logs in again (e.g. after the session expired). Errors are logged.
+
+        Returns
+        -------
+        bool
+            True if the login succeeded
+        """
+        logger.info('Logging in again')
+        try:
+            if self.tipper.login():
+                return True
+            logger.error('Login failed')
+        except Exception:
+            logger.exception('Login failed')
+        return False
+
+    def stop(self):
+        """ Stops run (e.g. from another thread or a signal handler) """
+        self._stop.set()
+
+    def run(self):
+        """ Runs until stop is called. The schedule of the upcoming matchday is read once and the kickoff groups are
+        submitted one after the other; then the schedule is read again. Errors are logged and do not stop the daemon.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                plan = self.schedule()
+            except Exception:
+                logger.exception('Reading the schedule failed')
+                self.login()  # the session may have expired
+                plan = []
+
+            if not plan:
+                logger.info('No open matches, next check in %s', self.replan_interval)
+                self._stop.wait(self.replan_interval.total_seconds())
+                continue
+
+            for due, kickoff in plan:
+                logger.info('Next submission at %s (kickoff %s)', due, kickoff)
+                if self._stop.wait(max((due - datetime.now()).total_seconds(), 0)):
+                    break
+                try:
+                    self.submit()
+                    self._submitted.add(kickoff)
+                except Exception:
+                    logger.exception('Submission failed')
+                    self.login()  # the session may have expired
+                    self._stop.wait(60)  # retry with the next schedule
+                    break
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+from scipy import optimize
+
+from . import fivethirtyeight
+from . import predictor
+
+
+class DixonColes:
+    """ Team strength model of Dixon and Coles, fitted from historical results.
+
+    The scores of a match are modelled as Poisson distributions with the expectation values
+    l1 = exp(intercept + home_advantage + attack[team1] + defense[team2])
+    l2 = exp(intercept + attack[team2] + defense[team1])
+    with a correction for the low scores 0:0, 0:1, 1:0 and 1:1 (correlation parameter rho, see
+    MatchPredictor.dixon_coles_correction). A higher defense parameter means that the team concedes more goals.
+
+    Matches are weighted with exp(-xi * age in days), so recent results count more.
+
+    See: Dixon, Coles. "Modelling association football scores and inefficiencies in the football betting market."
+    Journal of the Royal Statistical Society: Series C 46.2 (1997): 265-280.
+
+    Attributes
+    ----------
+    xi : float
+        Time decay rate per day
+    teams : list of str
+        Team names (order of attack and defense)
+    attack : nd.array
+        Attack parameters
+    defense : nd.array
+        Defense parameters
+    home_advantage : float
+    intercept : float
+    rho : float
+    """
+
+    def __init__(self, xi=0.0019):
+        self.xi = xi
+
+        self.teams = []
+        self.attack = np.zeros(0)
+        self.defense = np.zeros(0)
+        self.home_advantage = 0.25
+        self.intercept = 0.3
+        self.rho = 0.0
+
+        self._team_index = {}
+
+    @property
+    def _params(self):
+        return np.concatenate([self.attack, self.defense, [self.home_advantage, self.intercept, self.rho]])
+
+    def _initial_params(self, teams, warm_start):
+        """ Start values of the parameters. With warm_start, the values of the previous fit are reused for all known
+        teams.
+        """
+        n_teams = len(teams)
+        params = np.zeros(2*n_teams + 3)
+        params[-3:] = [0.25, 0.3, 0.0]
+        if warm_start and self.teams:
+            for k, team in enumerate(teams):
+                idx = self._team_index.get(team)
+                if idx is not None:
+                    params[k] = self.attack[idx]
+                    params[n_teams + k] = self.defense[idx]
+            params[-3:] = [self.home_advantage, self.intercept, self.rho]
+        return params
+
+    @staticmethod
+    def _neg_log_likelihood(params, home, away, goals1, goals2, weights, n_teams):
+        """ Weighted negative log-likelihood and its gradient.
+
+        The sums of the attack and defense parameters are constrained to zero by a quadratic penalty.
+        """
+        attack = params[:n_teams]
+        defense = params[n_teams:2*n_teams]
+        home_advantage, intercept, rho = params[-3:]
+
+        l1 = np.exp(intercept + home_advantage + attack[home] + defense[away])
+        l2 = np.exp(intercept + attack[away] + defense[home])
+
+        # Dixon-Coles correction tau and its derivatives with respect to l1, l2 and rho
+        tau = np.ones_like(l1)
+        dtau_dl1 = np.zeros_like(l1)
+        dtau_dl2 = np.zeros_like(l1)
+        dtau_drho = np.zeros_like(l1)
+        s00 = (goals1 == 0) & (goals2 == 0)
+        s01 = (goals1 == 0) & (goals2 == 1)
+        s10 = (goals1 == 1) & (goals2 == 0)
+        s11 = (goals1 == 1) & (goals2 == 1)
+        tau[s00] = 1 - l1[s00]*l2[s00]*rho
+        dtau_dl1[s00] = -l2[s00]*rho
+        dtau_dl2[s00] = -l1[s00]*rho
+        dtau_drho[s00] = -l1[s00]*l2[s00]
+        tau[s01] = 1 + l1[s01]*rho
+        dtau_dl1[s01] = rho
+        dtau_drho[s01] = l1[s01]
+        tau[s10] = 1 + l2[s10]*rho
+        dtau_dl2[s10] = rho
+        dtau_drho[s10] = l2[s10]
+        tau[s11] = 1 - rho
+        dtau_drho[s11] = -1
+        tau = np.maximum(tau, 1e-10)
+
+        log_likelihood = weights*(goals1*np.log(l1) - l1 + goals2*np.log(l2) - l2 + np.log(tau))
+        penalty = np.sum(attack)**2 + np.sum(defense)**2
+
+        # derivatives with respect to the linear predictors log(l1) and log(l2)
+        g1 = weights*(goals1 - l1 + l1*dtau_dl1/tau)
+        g2 = weights*(goals2 - l2 + l2*dtau_dl2/tau)
+
+        grad = np.zeros_like(params)
+        grad[:n_teams] = np.bincount(home, g1, n_teams) + np.bincount(away, g2, n_teams)
+        grad[n_teams:2*n_teams] = np.bincount(away, g1, n_teams) + np.bincount(home, g2, n_teams)
+        grad[-3] = np.sum(g1)
+        grad[-2] = np.sum(g1) + np.sum(g2)
+        grad[-1] = np.sum(weights*dtau_drho/tau)
+        grad = -grad
+        grad[:n_teams] += 2*np.sum(attack)
+        grad[n_teams:2*n_teams] += 2*np.sum(defense)
+
+        return -np.sum(log_likelihood) + penalty, grad
+
+    def fit(self, data, date=None, warm_start=True):
+        """ Fits the model by maximum likelihood.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Results with the columns 'team1', 'team2', 'score1', 'score2' and 'date' (e.g. FiveThirtyEight.data).
+            Matches without scores are ignored.
+        date : str or datetime, optional
+            Reference date for the time decay. If None (default), the date of the last match is used.
+        warm_start : bool
+            If True (default), the optimization starts at the parameters of the previous fit.
+
+        Returns
+        -------
+        DixonColes
+            self
+        """
+        data = data.dropna(subset=['score1', 'score2'])
+        teams = sorted(set(data['team1']) | set(data['team2']))
+        team_index = {team: k for k, team in enumerate(teams)}
+        n_teams = len(teams)
+
+        home = np.asarray(data['team1'].map(team_index), dtype=int)
+        away = np.asarray(data['team2'].map(team_index), dtype=int)
+        goals1 = data['score1'].values.astype(float)
+        goals2 = data['score2'].values.astype(float)
+        if pd.api.types.is_integer_dtype(data['date']):  # compact FiveThirtyEight data
+            dates = pd.Series(fivethirtyeight.dates_from_codes(data['date'])).astype('datetime64[ns]')
+        else:
+            dates = pd.to_datetime(data['date'])
+        date = dates.max() if date is None else pd.to_datetime(date)
+        weights = np.exp(-self.xi*(date - dates).dt.days.values.clip(0))
+
+        bounds = [(None, None)]*(2*n_teams + 2) + [(-0.3, 0.3)]
+        result = optimize.minimize(self._neg_log_likelihood, self._initial_params(teams, warm_start),
+                                   args=(home, away, goals1, goals2, weights, n_teams), jac=True, method='L-BFGS-B',
+                                   bounds=bounds)
+
+        self.teams = teams
+        self._team_index = team_index
+        self.attack = result.x[:n_teams]
+        self.defense = result.x[n_teams:2*n_teams]
+        self.home_advantage, self.intercept, self.rho = result.x[-3:]
+
+        return self
+
+    def lambdas(self, team1, team2):
+        """ Returns the expectation values of the scores.
+
+        Parameters
+        ----------
+        team1 : str or list of str
+            Home team(s)
+        team2 : str or list of str
+            Away team(s)
+
+        Returns
+        -------
+        nd.array, nd.array
+            Expectation values l1 and l2 (see MatchPredictor)
+        """
+        home = np.array([self._team_index[team] for team in np.atleast_1d(team1)])
+        away = np.array([self._team_index[team] for team in np.atleast_1d(team2)])
+        l1 = np.exp(self.intercept + self.home_advantage + self.attack[home] + self.defense[away])
+        l2 = np.exp(self.intercept + self.attack[away] + self.defense[home])
+        return l1, l2
+
+    def match_predictor(self, team1, team2):
+        """ Returns a MatchPredictor for a match, including the correlation parameter rho """
+        l1, l2 = self.lambdas(team1, team2)
+        return predictor.MatchPredictor(l1[0], l2[0], rho=self.rho)
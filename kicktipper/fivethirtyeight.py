@@ -1,32 +1,169 @@
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import urllib.request
 import ntpath
 import os
 
+from . import instrumentation as instr
+
+
+def date_code(date):
+    """ Integer code of a date (days since 1970-01-01), as used in the column 'date' of compact data
+
+    Parameters
+    ----------
+    date : str, datetime or array_like
+
+    Returns
+    -------
+    int or nd.array of int32
+    """
+    codes = np.asarray(pd.to_datetime(date), dtype='datetime64[D]').astype(np.int64)
+    return codes.astype(np.int32) if codes.ndim else int(codes)
+
+
+def dates_from_codes(codes):
+    """ Inverse of date_code: returns the dates as numpy.datetime64[D] """
+    return np.asarray(codes, dtype=np.int64).astype('datetime64[D]')
+
+
+def team_dtype(*teams):
+    """ Returns a categorical dtype mapping team names to integer codes (team-code dictionary)
+
+    Parameters
+    ----------
+    teams : lists of str
+        Team names. The codes follow the order of first appearance, so names from the first list keep their codes when
+        further lists are added.
+
+    Returns
+    -------
+    pandas.CategoricalDtype
+    """
+    names = dict.fromkeys(str(name) for names in teams for name in names if name == name)  # skip NaN
+    return pd.CategoricalDtype(list(names))
+
 
 class FiveThirtyEight:
-    def __init__(self):
+    def __init__(self, instrumentation=None):
         self.data = pd.DataFrame()
+        self.team_dtype = None  # team-code dictionary of self.data (if read with compact=True)
+        self.instrumentation = instrumentation if instrumentation is not None else instr.Instrumentation()
         self.url = 'https://projects.fivethirtyeight.com/soccer-api/club/spi_matches.csv'
         # see: https://github.com/fivethirtyeight/data/tree/master/soccer-spi
 
         self._save_dir = '../data'
 
-    def read_data(self, filename=None, update=False):
+    @instr.instrumented('fivethirtyeight.read')
+    def read_data(self, filename=None, update=False, league_id=1845, min_date='2019-08-01', compact=False,
+                  teams=None, season=None, chunksize=100000):
+        """ Reads the data file and stores the matches in self.data
+
+        Parameters
+        ----------
+        filename : str
+            Path to the data file. If None (default), the file in the default storage location is used.
+        update : bool
+            If True, the data file is downloaded before reading it.
+        league_id : int or list of int
+            ID(s) of the league(s) to keep. Defaults to 1845 (German Bundesliga). If None, all leagues are kept.
+        min_date : str
+            Only matches played on or after this date (format YYYY-MM-DD) are kept. Defaults to the beginning of the
+            2019/20 season. If None, matches from all seasons are kept.
+        compact : bool
+            If True, the data is stored in the compact typed format (float32, integer dates), see compact. Meant for
+            large histories, e.g. backtests. If False (default), all columns are stored as read from the CSV file
+            (float64 and str).
+        teams : list of str or pandas.CategoricalDtype, optional
+            Team-code dictionary to share (e.g. the teams of a league table), see compact
+        season : int or str, optional
+            Only matches of this season (year in which the season started) are kept. If 'latest', only the latest
+            season of the selected leagues is kept. If None (default), all seasons are kept.
+        chunksize : int
+            The file is read in chunks of this number of rows, which are filtered right away, so the full file is never
+            held in memory.
+
+        """
         if filename is None:
             filename = os.path.join(self._save_dir, 'spi_matches.csv')
 
         if update or not os.path.isfile(filename):
             self.download_data()
 
-        data = pd.read_csv(filename)
-        data = data[data['league_id'] == 1845]  # Keep only Bundesliga matches
-        data = data[data['date'] >= '2019-08-01']  # Keep only matches from 2019/20 season
-        data['team1'] = data['team1'].str.replace('FC Cologne', '1. FC Köln')
-        data['team2'] = data['team2'].str.replace('FC Cologne', '1. FC Köln')
+        # names repeated in every row are parsed into categories right away
+        dtype = dict.fromkeys(['league', 'team1', 'team2'], 'category') if compact else None
+        chunks = []
+        latest = None  # latest season read so far (season='latest')
+        for chunk in pd.read_csv(filename, dtype=dtype, chunksize=chunksize):
+            if league_id is not None:
+                chunk = chunk[chunk['league_id'].isin(np.atleast_1d(league_id))]
+            if min_date is not None:
+                chunk = chunk[chunk['date'] >= min_date]
+            if season == 'latest' and len(chunk):
+                latest = chunk['season'].max() if latest is None else max(latest, chunk['season'].max())
+                chunks = [c[c['season'] == latest] for c in chunks]
+                chunk = chunk[chunk['season'] == latest]
+            elif season is not None and season != 'latest':
+                chunk = chunk[chunk['season'] == season]
+            chunks.append(chunk)
+        if dtype is not None and len(chunks) > 1:  # common categories, so the columns stay categorical
+            for column in dtype:
+                categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+                chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(categories)}) for chunk in chunks]
+        data = pd.concat(chunks) if chunks else pd.read_csv(filename, dtype=dtype, nrows=0)
+        names = {'FC Cologne': '1. FC Köln'}
+        data['team1'] = data['team1'].map(lambda name: names.get(name, name))  # maps only the categories if compact
+        data['team2'] = data['team2'].map(lambda name: names.get(name, name))
         data = data.reset_index()
+        if compact:
+            data = self.compact(data, teams)
+            self.team_dtype = data['team1'].dtype
         self.data = data
+        self.instrumentation.count_rows(len(data))
+
+    @staticmethod
+    def compact(data, teams=None):
+        """ Converts the data to the compact typed format.
+
+        * 'team1' and 'team2': categorical with a common team-code dictionary
+        * 'league': categorical
+        * 'date': integer code (days since 1970-01-01, see date_code and dates_from_codes)
+        * floats (probabilities, projected scores, scores, ...): float32
+        * integers (season, league_id): smallest integer type
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data in the format of the CSV file
+        teams : list of str or pandas.CategoricalDtype, optional
+            Team-code dictionary to share, e.g. the teams of a league table. Teams not contained are appended, so the
+            codes of the given teams stay the same. If None (default), the teams of data are used.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        data = data.copy()
+        if isinstance(teams, pd.CategoricalDtype):
+            teams = teams.categories
+        dtype = team_dtype(teams if teams is not None else [], data['team1'].unique(), data['team2'].unique())
+        data['team1'] = data['team1'].astype(dtype)
+        data['team2'] = data['team2'].astype(dtype)
+        if 'league' in data:
+            data['league'] = data['league'].astype('category').cat.remove_unused_categories()
+
+        for column in data.columns:
+            if pd.api.types.is_float_dtype(data[column]):
+                data[column] = data[column].astype(np.float32)
+            elif pd.api.types.is_integer_dtype(data[column]):
+                data[column] = pd.to_numeric(data[column], downcast='integer')
+
+        if 'date' in data:
+            data['date'] = date_code(data['date'])
+        return data
 
+    @instr.instrumented('fivethirtyeight.download')
     def download_data(self, url=None, save_dir=None):
         """ Downloads a data file
 
@@ -48,4 +185,5 @@ class FiveThirtyEight:
 
         filename = os.path.join(save_dir, ntpath.basename(url))
         urllib.request.urlretrieve(url, filename)
+        self.instrumentation.count_request(os.path.getsize(filename))
 
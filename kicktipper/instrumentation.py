@@ -0,0 +1,151 @@
+import pandas as pd
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """ Records wall time, HTTP requests and processed rows of pipeline stages.
+
+    Stages are recorded with the context manager stage or the decorator instrumented. Stages may be nested; HTTP
+    requests and rows count for all active stages. Requests and rows may be counted from worker threads (see
+    KicktippAPI.read_members).
+
+    Attributes
+    ----------
+    records : collections.deque of dict
+        One record per executed stage: stage, start (unix time), wall_time (s), requests, bytes, rows. Only the last
+        max_records records are kept, so a long running process (see daemon.TipperDaemon) does not grow without limit.
+    max_records : int or None
+        Maximum number of records kept. If None, all records are kept.
+    profile_stats : pstats.Stats
+        Statistics of the last call of profile
+    """
+
+    def __init__(self, max_records=10000):
+        self.max_records = max_records
+        self.records = deque(maxlen=max_records)
+        self.profile_stats = None
+        self._active = []
+        self._lock = threading.Lock()  # guards _active and the counters of the active records
+
+    @contextmanager
+    def stage(self, name):
+        """ Context manager recording a stage. Yields the record, so rows can be added by the caller. """
+        record = {'stage': name, 'start': time.time(), 'wall_time': 0.0, 'requests': 0, 'bytes': 0, 'rows': 0}
+        with self._lock:
+            self._active.append(record)
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter() - t0
+            with self._lock:
+                self._active.remove(record)
+                self.records.append(record)
+
+    def count_request(self, n_bytes=0):
+        """ Counts an HTTP request (and the size of its response) for all active stages """
+        with self._lock:
+            for record in self._active:
+                record['requests'] += 1
+                record['bytes'] += n_bytes
+
+    def count_rows(self, n_rows):
+        """ Counts processed rows for all active stages """
+        with self._lock:
+            for record in self._active:
+                record['rows'] += n_rows
+
+    def attach_session(self, session):
+        """ Counts all requests of a requests.Session (e.g. the session of a mechanicalsoup.StatefulBrowser) """
+        def hook(response, *args, **kwargs):
+            self.count_request(len(response.content))
+        session.hooks['response'].append(hook)
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+
+    def summary(self):
+        """ Returns the totals per stage
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns: calls, wall_time, requests, bytes, rows
+        """
+        df = pd.DataFrame(list(self.records), columns=['stage', 'start', 'wall_time', 'requests', 'bytes', 'rows'])
+        return df.groupby('stage').agg(calls=('start', 'size'), wall_time=('wall_time', 'sum'),
+                                       requests=('requests', 'sum'), bytes=('bytes', 'sum'), rows=('rows', 'sum'))
+
+    def to_json(self):
+        """ Returns the records as JSON lines (one JSON object per stage execution) """
+        return '\n'.join(json.dumps(record) for record in self.records)
+
+    def write_json(self, filename):
+        """ Appends the records as JSON lines to a file """
+        with open(filename, 'a') as f:
+            f.write(self.to_json() + '\n')
+
+    def to_prometheus(self, prefix='kicktipper'):
+        """ Returns the totals per stage in the Prometheus text exposition format """
+        summary = self.summary()
+        metrics = [('stage_calls_total', 'calls', 'Number of executions of the stage'),
+                   ('stage_seconds_total', 'wall_time', 'Wall time spent in the stage'),
+                   ('http_requests_total', 'requests', 'HTTP requests during the stage'),
+                   ('http_response_bytes_total', 'bytes', 'Size of the HTTP responses during the stage'),
+                   ('rows_total', 'rows', 'Rows processed during the stage')]
+        lines = []
+        for metric, column, description in metrics:
+            name = prefix + '_' + metric
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for stage, value in summary[column].items():
+                lines.append('{}{{stage="{}"}} {}'.format(name, stage, value))
+        return '\n'.join(lines) + '\n'
+
+    def profile(self, func, *args, filename=None, **kwargs):
+        """ Runs func(*args, **kwargs) with cProfile and stores the statistics in self.profile_stats
+
+        Parameters
+        ----------
+        func : callable
+        filename : str, optional
+            If given, the statistics are also written to this file (readable with pstats or snakeviz)
+
+        Returns
+        -------
+        Return value of func
+        """
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.profile_stats = pstats.Stats(profiler)
+            if filename is not None:
+                self.profile_stats.dump_stats(filename)
+
+
+def instrumented(stage_name):
+    """ Decorator for methods: records the method as stage in self.instrumentation (if not None). If the method returns
+    a pandas.DataFrame, its rows are counted for this stage.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = getattr(self, 'instrumentation', None)
+            if instrumentation is None:
+                return method(self, *args, **kwargs)
+            with instrumentation.stage(stage_name) as record:
+                result = method(self, *args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    record['rows'] += len(result)
+                return result
+        return wrapper
+    return decorator
@@ -1,8 +1,17 @@
 import mechanicalsoup
+import requests
 import re
 import pandas as pd
 import warnings
 import getpass
+import json
+import os
+import stat
+from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from . import instrumentation as instr
 
 
 class KicktippAPI:
@@ -14,18 +23,30 @@ class KicktippAPI:
         Name of the kicktipp group
     members : pandas.DataFrame
         DataFrame containing registered members of the kicktipp group
+    member_names : dict
+        Member ID => name of the registered members (see read_members)
+    instrumentation : instrumentation.Instrumentation
+        Records wall time, HTTP requests and rows of the API calls
+    session_file : str
+        If set, the cookies of the login session are saved to this file (readable only by the owner) and reused by the
+        next login, see login. While logged in, the file is updated whenever the server changes the cookies.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, instrumentation=None):
         """
 
         Parameters
         ----------
         name : str
             Name of the kicktipp group
+        instrumentation : instrumentation.Instrumentation, optional
+            If None (default), a new Instrumentation object is created.
         """
         self._name = self.name = name
         self.members = pd.DataFrame(columns=['name', 'id'])
+        self.member_names = {}
+        self._member_ids = {}  # name => member ID
+        self._n_member_pages = None  # number of pages of the member list at the last read_members
 
         self._url = "https://www.kicktipp.de/" + self._name + "/"
         self._url_login = self._url + "profil/login"
@@ -33,6 +54,12 @@ class KicktippAPI:
         self._url_tippabgabe = self._url + "tippabgabe"
 
         self._browser = mechanicalsoup.StatefulBrowser(soup_config={'features': 'html5lib'})
+        self.session_file = None
+        self._logged_in = False
+        self._saved_cookies = None  # cookies last written to session_file, see _save_session_if_changed
+
+        self.instrumentation = instrumentation if instrumentation is not None else instr.Instrumentation()
+        self.instrumentation.attach_session(self._browser.session)
 
     @property
     def name(self):
@@ -55,6 +82,7 @@ class KicktippAPI:
     def read_password_from_user_input():
         return getpass.getpass('Password: ')
 
+    @instr.instrumented('kicktipp.fetch')
     def _browser_open(self, url):
         """ Open URL.
 
@@ -72,14 +100,93 @@ class KicktippAPI:
 
         """
         self._browser.open(url)
+        self._save_session_if_changed()
         if self._browser.get_url() == url:
             return True
         else:
             return False
 
+    def _cookies(self):
+        return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires,
+                 'secure': c.secure} for c in self._browser.session.cookies]
+
+    def _save_session_if_changed(self):
+        """ Saves the session if logged in, session_file is set and the cookies changed since they were saved (e.g.
+        the server refreshed the login cookie), so the next run does not load stale cookies.
+        """
+        if self._logged_in and self.session_file is not None and self._cookies() != self._saved_cookies:
+            self.save_session()
+
+    def save_session(self, filename=None):
+        """ Saves the cookies of the session to a JSON file, which is only readable by the owner.
+
+        Parameters
+        ----------
+        filename : str
+            If None (default), self.session_file is used.
+        """
+        if filename is None:
+            filename = self.session_file
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):  # create directory if it does not exist
+            os.makedirs(directory)
+
+        cookies = self._cookies()
+        # create the file with permissions 600 (the cookies grant access to the account)
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
+        os.chmod(filename, stat.S_IRUSR | stat.S_IWUSR)  # in case the file existed with other permissions
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cookies, f)
+        if filename == self.session_file:
+            self._saved_cookies = cookies
+
+    def load_session(self, filename=None):
+        """ Loads cookies saved by save_session into the session.
+
+        Parameters
+        ----------
+        filename : str
+            If None (default), self.session_file is used.
+
+        Returns
+        -------
+        bool
+            True if cookies were loaded, False if the file does not exist or can be read by other users.
+        """
+        if filename is None:
+            filename = self.session_file
+        if not os.path.isfile(filename):
+            return False
+        if os.stat(filename).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            warnings.warn('Session file ' + filename + ' is accessible by other users and is not used.')
+            return False
+
+        with open(filename) as f:
+            cookies = json.load(f)
+        for cookie in cookies:
+            self._browser.session.cookies.set_cookie(requests.cookies.create_cookie(**cookie))
+        if filename == self.session_file:
+            self._saved_cookies = self._cookies()
+        return True
+
+    def session_valid(self):
+        """ Checks if the session is logged in, with a single request: the tippabgabe page redirects to the login page
+        if the session is not logged in.
+
+        Returns
+        -------
+        bool
+        """
+        return self._browser_open(self._url_tippabgabe)
+
+    @instr.instrumented('kicktipp.login')
     def login(self, username=None, password=None):
         """ Logs into the kicktipp website in the current group.
 
+        If self.session_file is set and contains a session which is still logged in, this session is used and no
+        login form is submitted (and no credentials are asked). Otherwise the session is saved to self.session_file
+        after a successful login. While logged in, the session is saved again whenever its cookies change.
+
         Parameters
         ----------
         username : str
@@ -92,6 +199,12 @@ class KicktippAPI:
             True if login was successful, False otherwise.
 
         """
+        if self.session_file is not None and self.load_session() and self.session_valid():
+            self._logged_in = True
+            self._save_session_if_changed()  # cookies refreshed by the validation request
+            return True
+        self._logged_in = False
+
         if username is None:
             username = self.read_username_from_user_input()
         if password is None:
@@ -109,12 +222,15 @@ class KicktippAPI:
         self._browser.submit_selected()
 
         if self._browser.get_url() == self._url:  # redirection to group page successful?
+            self._logged_in = True
+            if self.session_file is not None:
+                self.save_session()
             return True
         else:
             return False
 
     def logout(self):
-        """ Logs out from current account.
+        """ Logs out from current account. The saved session (see session_file) is deleted, as it is not valid anymore.
 
         Returns
         -------
@@ -122,8 +238,12 @@ class KicktippAPI:
             True if logout was successful, False otherwise
 
         """
+        self._logged_in = False
+        if self.session_file is not None and os.path.isfile(self.session_file):
+            os.remove(self.session_file)
         return self._browser_open(self._url_logout)
 
+    @instr.instrumented('kicktipp.read_games')
     def read_games(self, matchday=None):
         """ Reads data of a matchday from the kicktipp website
 
@@ -138,11 +258,7 @@ class KicktippAPI:
             Dataframe containing the games, points and odds
 
         """
-        if matchday is None:
-            url = self._url_tippabgabe
-        else:
-            url = self._url_tippabgabe + '?&spieltagIndex=' + str(matchday)
-        if self._browser_open(url):
+        if self._browser_open(self._tippabgabe_url(matchday)):
             soup = self._browser.get_current_page()
             data = soup.find_all('td', {'class': 'nw'})
 
@@ -243,6 +359,7 @@ class KicktippAPI:
         else:
             return None
 
+    @instr.instrumented('kicktipp.read_predictions')
     def read_predictions(self, member, matchday):
         """ Reads predictions from a member for a specific matchday
 
@@ -259,7 +376,9 @@ class KicktippAPI:
             Dataframe containing the predictions
         """
         if type(member) is str:  # assume the member name is passed => convert to ID
-            member_id = self.members[self.members['name'] == member]['id'].item()
+            if member not in self._member_ids:
+                self.read_members()
+            member_id = self._member_ids[member]
         else:
             member_id = member
         url = self._url + 'tippuebersicht/tipper?spieltagIndex=' + str(matchday) + '&rankingTeilnehmerId=' \
@@ -311,8 +430,83 @@ class KicktippAPI:
 
             return tipps
 
-    def read_members(self):
-        """ Reads the members and corresponding IDs and stores it in the pandas.DataFrame self.members
+    @instr.instrumented('kicktipp.read_all_predictions')
+    def read_all_predictions(self, matchday):
+        """ Reads the predictions of all members for a specific matchday with a single request from the matchday
+        overview page (tippuebersicht)
+
+        Predictions of other members are only shown after the kickoff of the match, hidden predictions are None.
+
+        Parameters
+        ----------
+        matchday : int
+            Matchday to be read
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per member and match, columns: member_id, member_name, team1, team2, tipp1, tipp2 (the format of
+            read_predictions with the member columns added)
+        """
+        url = self._url + 'tippuebersicht?spieltagIndex=' + str(matchday)
+        if self._browser_open(url):
+            return self._parse_tippuebersicht(self._browser.get_current_page())
+
+    @classmethod
+    def _parse_tippuebersicht(cls, soup):
+        """ Parses the matches and the predictions of all members from the matchday overview page.
+
+        Experimental: the expected markup is described below and pinned by tests/test_kicktipp_api.py, but it was not
+        checked against a captured page of the live site.
+
+        The matches are the rows of the match table (cells of class "nw", as on the tippabgabe page). Each member is a
+        row of class "teilnehmer" (with the attribute "data-teilnehmer-id" and a cell of class "name"), followed by one
+        cell per match (class "ereignis"), which contains the prediction (e.g. "2:1") and possibly the points.
+        """
+        columns = ['member_id', 'member_name', 'team1', 'team2', 'tipp1', 'tipp2']
+        team_name = re.compile(r'^[a-zA-Z0-9ZäöüÄÖÜß._\-\s]+$')  # see read_predictions
+        score = re.compile(r'(\d+)\s*:\s*(\d+)')
+
+        matches = []
+        for row in soup.find_all('tr'):
+            if 'teilnehmer' in row.get('class', []):
+                continue
+            names = [el.string.strip() for el in row.find_all('td', {'class': 'nw'})
+                     if el.string is not None and not el.find_all() and team_name.match(el.string)
+                     and not score.search(el.string)]
+            if len(names) >= 2:
+                matches.append(names[:2])
+
+        rows = []
+        for row in soup.find_all('tr', {'class': 'teilnehmer'}):
+            member_id = int(row.attrs['data-teilnehmer-id'])
+            name_tag = row.find('td', {'class': 'name'})
+            member_name = name_tag.get_text(strip=True) if name_tag is not None else None
+            cells = [td for td in row.find_all('td') if any(c.startswith('ereignis') for c in td.get('class', []))]
+            for (team1, team2), cell in zip(matches, cells):
+                # the points are in a sub tag, so only the direct text of the cell is parsed
+                text = ''.join(cell.find_all(string=True, recursive=False)) or cell.get_text()
+                tipp = score.search(text)
+                tipp1, tipp2 = (int(tipp.group(1)), int(tipp.group(2))) if tipp else (None, None)
+                rows.append((member_id, member_name, team1, team2, tipp1, tipp2))
+
+        return pd.DataFrame(rows, columns=columns)
+
+    @instr.instrumented('kicktipp.read_members')
+    def read_members(self, refresh=False, n_workers=4):
+        """ Reads the members and corresponding IDs and stores it in the pandas.DataFrame self.members and the dict
+        self.member_names
+
+        The member list (gesamtuebersicht) of large groups spans several pages, which are read in parallel. As members
+        rarely change, the further pages are only read if the first page contains unknown members or the number of
+        pages changed.
+
+        Parameters
+        ----------
+        refresh : bool
+            If True, all pages are read.
+        n_workers : int
+            Number of pages read in parallel
 
         Returns
         -------
@@ -322,66 +516,172 @@ class KicktippAPI:
         url = self._url + 'gesamtuebersicht'
         if self._browser_open(url):
             soup = self._browser.get_current_page()
-            data = soup.find_all('td', {"class": 'name'})
-
-            names = []
-            for el in data:
-                names.append(str(el.string))
+            members = self._parse_members(soup)
+            pages = self._member_page_urls(soup, url)
+
+            unchanged = (len(pages) == self._n_member_pages and set(members) <= set(self.member_names))
+            if refresh or not unchanged:
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    for page_members in executor.map(self._read_member_page, pages):
+                        members.update(page_members)
+                self.member_names = members  # all pages read: members who left are removed
+            else:
+                self.member_names.update(members)  # e.g. renamed members
+            self._n_member_pages = len(pages)
+
+            self._member_ids = {name: member_id for member_id, name in self.member_names.items()}
+            self.members = pd.DataFrame({'name': list(self.member_names.values()),
+                                         'id': list(self.member_names.keys())}, columns=['name', 'id'])
+            return self.members
 
-            data = soup.find_all('tr', {"class": 'teilnehmer'})  # "TeilnehmerID"
-            ids = []
-            for el in data:
-                ids.append(int(el.attrs['data-teilnehmer-id']))
+    def _read_member_page(self, url):
+        """ Reads a further page of the member list. Runs in a worker thread, so the page is fetched with a separate
+        session (with the cookies of the logged in browser session) instead of the browser, as requests.Session is not
+        guaranteed to be thread safe.
+        """
+        with requests.Session() as session:
+            session.headers.update(self._browser.session.headers)
+            session.cookies.update(self._browser.session.cookies)
+            self.instrumentation.attach_session(session)
+            response = session.get(url)
+        response.raise_for_status()
+        return self._parse_members(BeautifulSoup(response.text, 'html5lib'))
 
-            self.members['name'] = names
-            self.members['id'] = ids
+    @staticmethod
+    def _parse_members(soup):
+        """ Returns the members of a page of the member list as dict: member ID => name """
+        members = {}
+        for row in soup.find_all('tr', {"class": 'teilnehmer'}):  # "TeilnehmerID"
+            name = row.find('td', {"class": 'name'})
+            members[int(row.attrs['data-teilnehmer-id'])] = str(name.string) if name is not None else None
+        return members
 
-            return self.members
+    @staticmethod
+    def _member_page_urls(soup, url):
+        """ Returns the URLs of the further pages (page 2, 3, ...) of the member list, from the links of the pagination
 
-    def submit_predictions(self, scores, matchday=None, n_matches=9):
-        """ Uploads the matchday predictions to the kicktipp website
+        Experimental (heuristic, not checked against a paged member list of the live site, see
+        tests/test_kicktipp_api.py): the pagination links are the links to the gesamtuebersicht whose text is the page
+        number. The name of the page parameter in the URL is not evaluated. Links to a matchday (parameter
+        spieltagIndex) are not page links, and only consecutive page numbers 2, 3, ... are used.
+        """
+        pages = {}
+        for link in soup.find_all('a', href=True):
+            href = urljoin(url, link['href'])
+            text = link.get_text(strip=True)
+            if 'gesamtuebersicht' in href and 'spieltagIndex' not in href and text.isdigit() and int(text) > 1:
+                pages.setdefault(int(text), href)
+        urls = []
+        for page in range(2, len(pages) + 2):  # stop at the first gap
+            if page not in pages:
+                break
+            urls.append(pages[page])
+        return urls
+
+    @instr.instrumented('kicktipp.read_tipps')
+    def read_tipps(self, matchday=None):
+        """ Reads the own tipps currently entered in the form of the tippabgabe page
 
         The user must be logged in.
 
         Parameters
         ----------
-        scores : 2-d array with 2 columns
-            Containing the predicted scores
         matchday : int, optional
             Number of matchday to be read. If None (default), the upcoming matchday is read.
-        n_matches : int
-            Number of matches per matchday, defaults to 9
 
+        Returns
+        -------
+        pandas.DataFrame
+            One row per match not played yet, columns: form_id, tipp1, tipp2 (None if no tipp is entered)
         """
+        if self._browser_open(self._tippabgabe_url(matchday)):
+            return pd.DataFrame(self._tipp_form_values(self._browser.get_current_page()),
+                                columns=['form_id', 'tipp1', 'tipp2'])
+
+    def _tippabgabe_url(self, matchday=None):
         if matchday is None:
-            url = self._url_tippabgabe
+            return self._url_tippabgabe
         else:
-            url = self._url_tippabgabe + '?&spieltagIndex=' + str(matchday)
+            return self._url_tippabgabe + '?&spieltagIndex=' + str(matchday)
 
-        if self._browser_open(url):
-            tipp_form = self._browser.select_form('form[id="tippabgabeForm"]')
-            soup = self._browser.get_current_page()
+    @staticmethod
+    def _tipp_form_values(soup):
+        """ Reads the IDs and current values of the tipp forms from the tippabgabe page
+
+        The forms have the name "spieltippForms[ID].heimTipp" and "spieltippForms[ID].gastTipp", where ID is an integer
+        specifying the individual form. Only matches not played yet have a form.
+
+        Returns
+        -------
+        list of tuple
+            (form ID, tipp team 1, tipp team 2), tipps are None if no tipp is entered
+        """
+        def value(tag, name):
+            field = tag.find('input', {'name': name})
+            if field is None or not field.get('value', '').strip():
+                return None
+            return int(field['value'])
+
+        forms = []
+        for tag in soup.find_all('td', {'class': 'kicktipp-tippabgabe'}):  # iterate over tags in form
+            # Example for tag.find_all()[0]['name']: "spieltippForms[697554851].tippAbgegeben"
+            id_ = int(re.findall(r'\d+', tag.find_all()[0]['name'])[0])
+            form_name = 'spieltippForms[' + str(id_) + ']'
+            forms.append((id_, value(tag, form_name + '.heimTipp'), value(tag, form_name + '.gastTipp')))
+        return forms
+
+    @instr.instrumented('kicktipp.submit')
+    def submit_predictions(self, scores, matchday=None, n_matches=9, refresh=True):
+        """ Uploads the matchday predictions to the kicktipp website
+
+        The user must be logged in. Only tipps which differ from the tipps already entered are changed. If no tipp
+        changed, nothing is submitted.
 
-            # Get the names of the individual forms
-            # The forms have the name "spieltippForms[ID].heimTipp" and "spieltippForms[ID].gastTipp", where ID
-            # is an integer specifying the individual form.
-            # Get these IDs from the form:
-            form_ids = []
-            for tag in soup.find_all('td', {'class':'kicktipp-tippabgabe'}): # iterate over tags in form
-                id_ = int(re.findall(r'\d+', tag.find_all()[0]['name'])[0])
-                form_ids.append(id_)
-                # Example for tag.find_all()[0]['name']: "spieltippForms[697554851].tippAbgegeben"
-
-            n_not_played = len(form_ids)  # number of matches of this matchday not played yet
-
-            # iteration starts at "n_matches-n_not_played": matches that are already played are ignored
-            # e.g. if you submit your scores on saturday, the score from the friday's match will be ignored.
-            for idx, score in enumerate(scores[n_matches-n_not_played:]):
-                form_name = 'spieltippForms[' + str(form_ids[idx]) + ']'
-                tipp_form[form_name + '.heimTipp'] = score[0]
-                tipp_form[form_name + '.gastTipp'] = score[1]
+        Parameters
+        ----------
+        scores : 2-d array with 2 columns
+            Containing the predicted scores. Matches whose score is None or NaN are skipped, their tipps are not
+            changed.
+        matchday : int, optional
+            Number of matchday to be read. If None (default), the upcoming matchday is read.
+        n_matches : int
+            Number of matches per matchday, defaults to 9
+        refresh : bool
+            If False and the tippabgabe page of the matchday is already open (e.g. after read_games), the open page is
+            used instead of fetching it again. Defaults to True.
 
+        Returns
+        -------
+        bool
+            True if changed tipps were submitted, False otherwise
+        """
+        url = self._tippabgabe_url(matchday)
+
+        if refresh or self._browser.get_url() != url:
+            if not self._browser_open(url):
+                return False
+
+        tipp_form = self._browser.select_form('form[id="tippabgabeForm"]')
+        forms = self._tipp_form_values(self._browser.get_current_page())
+        n_not_played = len(forms)  # number of matches of this matchday not played yet
+
+        # iteration starts at "n_matches-n_not_played": matches that are already played are ignored
+        # e.g. if you submit your scores on saturday, the score from the friday's match will be ignored.
+        changed = False
+        for (form_id, tipp1, tipp2), score in zip(forms, scores[n_matches-n_not_played:]):
+            if score is None or pd.isna(score[0]) or pd.isna(score[1]):
+                continue
+            if tipp1 == int(score[0]) and tipp2 == int(score[1]):
+                continue
+            form_name = 'spieltippForms[' + str(form_id) + ']'
+            tipp_form[form_name + '.heimTipp'] = score[0]
+            tipp_form[form_name + '.gastTipp'] = score[1]
+            changed = True
+
+        if changed:
             self._browser.submit_selected()
+            self._save_session_if_changed()
+        return changed
 
     def _parse_score(self, element) -> list:
         """ Generic method to parse a score.
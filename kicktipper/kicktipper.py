@@ -3,14 +3,24 @@
 import tkinter as tk
 from tkinter import messagebox as tkmessagebox
 import configparser
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from . import tipper
+from . import kicktipp_api
 from . import gui
 
+try:
+    from importlib.metadata import version
+    __version__ = version('kicktipper')
+except Exception:  # Python < 3.8 or package not installed
+    __version__ = 'unknown'
+
 
 class Model:
     def __init__(self):
-        self.liga = tipper.Liga("Bundesliga")
+        self.liga = tipper.League("Bundesliga")
         self.team_array = [None]*18
         self.home_team_advantage = 0
         self.mu = 0
@@ -33,11 +43,19 @@ class Model:
 
 
 class Controller:
+    POLL_INTERVAL = 100  # ms, interval in which the main loop checks for results of the background worker
+
     def __init__(self, master=None):
         self._master = master
         self.model = Model()
 
-        self.kicktipp_api = tipper.KicktippAPI("")  # Constructur will again be called in "login"
+        # Network requests and computations run in a background thread, so the window does not freeze. Tk is not
+        # thread safe: the results are handed back to the main loop by polling with after(). There is only one worker,
+        # so two tasks never use the (not thread safe) browser of self.kicktipp_api at the same time.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None  # (future, description, callback, start time, cancel event) of the running background task
+
+        self.kicktipp_api = kicktipp_api.KicktippAPI("")  # Constructur will again be called in "login"
 
         # Initialize the model
         self.read_config()
@@ -53,8 +71,77 @@ class Controller:
         self.main_view.file_menu.filemenu.entryconfig(2, command=self.show_info)
         self.main_view.file_menu.connectionmenu.entryconfig(0, command=self.login)
         self.main_view.file_menu.connectionmenu.entryconfig(1, command=self.logout)
+        self._master.bind('<Escape>', lambda event: self.cancel())
 
         self.set_statusbar("Offline")
+        self._status = "Offline"  # status bar text shown when no background task is running
+
+    def run_in_background(self, description, func, callback=None):
+        """ Runs func in the background worker thread and calls callback(result) in the Tk main loop when it is done.
+
+        While the task is running, its description and the elapsed time are shown in the status bar. Only one task
+        runs at a time; if another task is running (also a cancelled one which has not stopped yet), the call is
+        ignored. Exceptions of func are shown in a message box.
+
+        :param string description: Text shown in the status bar
+        :param func: Function with one argument, a threading.Event which is set when the task is cancelled. func should
+         check it between its steps (e.g. HTTP requests) and return early if it is set.
+        :param callback: Function called with the return value of func. Not called if the task was cancelled.
+        """
+        if self._task is not None:
+            if self._task[4].is_set():
+                self.set_statusbar(self._task[1] + " (cancelling, please wait)")
+            else:
+                self.set_statusbar(self._task[1] + " (busy, press Esc to cancel)")
+            return
+        cancel = threading.Event()
+        self._task = (self._executor.submit(func, cancel), description, callback, time.time(), cancel)
+        self.set_statusbar(description + "...")
+        self._master.after(self.POLL_INTERVAL, self._poll_task, self._task[0])
+
+    def _poll_task(self, future):
+        """ Checks the background task in the Tk main loop and hands over its result """
+        if self._task is None or self._task[0] is not future:  # cancelled before it started
+            return
+        _, description, callback, start, cancel = self._task
+        if not future.done():
+            if cancel.is_set():
+                self.set_statusbar("{}: cancelling...".format(description))
+            else:
+                self.set_statusbar("{}... {:.0f} s (Esc to cancel)".format(description, time.time() - start))
+            self._master.after(self.POLL_INTERVAL, self._poll_task, future)
+            return
+
+        self._task = None
+        self.set_statusbar(self._status)
+        if cancel.is_set():  # the result of a cancelled task is discarded
+            print(description + " cancelled")
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(description + " failed:", e)
+            tkmessagebox.showinfo("Error", description + " failed. Check your internet connection.\n\n" + str(e))
+            return
+        if callback is not None:
+            callback(result)
+
+    def cancel(self):
+        """ Cancels the running background task.
+
+        The task stops at its next check of the cancel event (see run_in_background); a request already sent is not
+        interrupted. Its result is discarded. No new task is started until the cancelled task has stopped.
+        """
+        if self._task is None:
+            return
+        future, description, _, _, cancel = self._task
+        cancel.set()
+        if future.cancel():  # the task has not started yet
+            self._task = None
+            print(description + " cancelled")
+            self.set_statusbar(self._status)
+        else:
+            self.set_statusbar("{}: cancelling...".format(description))
 
     def read_config(self):
         """ Read config file and update internal variables
@@ -133,26 +220,35 @@ class Controller:
 
     def generate_score(self):
         if self.main_view.main_widgets.v_score_generator.get() == "xS":
-            for kk in range(9):
-                team_name1 = self.main_view.main_widgets.v_team_list[2*kk].get()
-                team_name2 = self.main_view.main_widgets.v_team_list[2*kk+1].get()
-                team1 = self.model.liga.get_team_object_from_team_name(team_name1, exact_match=False)
-                team2 = self.model.liga.get_team_object_from_team_name(team_name2, exact_match=False)
-
-                score1, score2 = tipper.ScoreCalculator.expected_score(self.model.mu, self.model.home_team_advantage,
-                                                                       team1, team2)
-                self.main_view.main_widgets.v_results_list[2*kk].set(score1)
-                self.main_view.main_widgets.v_results_list[2*kk+1].set(score2)
-
-                self.update_scores()
+            team_names = [self.main_view.main_widgets.v_team_list[kk].get() for kk in range(18)]
+
+            score_calculator = tipper.ScoreCalculator()
+            score_calculator.mu = self.model.mu
+            score_calculator.home_team_advantage = self.model.home_team_advantage
+
+            def predict(cancel):
+                # the (fuzzy) lookup of the team names is done team by team, so the task can be cancelled in between
+                rows = []
+                for team_name in team_names:
+                    if cancel.is_set():
+                        return None
+                    rows.extend(self.model.liga.rows_from_team_names([team_name], exact_match=False))
+                return score_calculator.expected_tip_matrix(self.model.liga)[rows[0::2], rows[1::2]]
+            self.run_in_background("Predicting scores", predict, self.show_scores)
 
         elif self.main_view.main_widgets.v_score_generator.get() == "Random":
-            for kk in range(9):
-                score1, score2 = tipper.ScoreCalculator.random_score(self.model.mu)
-                self.main_view.main_widgets.v_results_list[2*kk].set(score1)
-                self.main_view.main_widgets.v_results_list[2*kk+1].set(score2)
+            score_calculator = tipper.ScoreCalculator()
+            score_calculator.mu = self.model.mu
+            self.run_in_background("Generating scores", lambda cancel: score_calculator.random_scores(9),
+                                   self.show_scores)
+
+    def show_scores(self, scores):
+        """ Displays generated scores (array with 9 rows and 2 columns) """
+        for kk in range(9):
+            self.main_view.main_widgets.v_results_list[2*kk].set(int(scores[kk, 0]))
+            self.main_view.main_widgets.v_results_list[2*kk+1].set(int(scores[kk, 1]))
 
-                self.update_scores()
+        self.update_scores()
 
     def show_info(self):
         """ Display the info screen
@@ -167,47 +263,71 @@ class Controller:
 
         if not login_dialog.canceled:
             print("Logging in... ")
-            try:
-                self.model.group = login_dialog.group
-                self.model.username = login_dialog.username
-                self.write_config()
-                self.kicktipp_api = tipper.KicktippAPI(login_dialog.group)
-                login_status = self.kicktipp_api.login(login_dialog.username, login_dialog.password)
-            except:
-                tkmessagebox.showinfo("Login failed", "Check your internet connection.")
-                raise
-
-            if login_status == 0:
-                print("Login succesful")
-                self.set_statusbar("Logged in as " + self.model.username + " in " + self.model.group)
-                tkmessagebox.showinfo("Info", "Login succesful")
-            else:
-                print("Login failed")
-                tkmessagebox.showinfo("Error", "Login failed")
+            self.model.group = login_dialog.group
+            self.model.username = login_dialog.username
+            self.write_config()
+            api = kicktipp_api.KicktippAPI(login_dialog.group)
+
+            def login_done(login_status):
+                if login_status:
+                    print("Login succesful")
+                    self.kicktipp_api = api
+                    self._status = "Logged in as " + self.model.username + " in " + self.model.group
+                    self.set_statusbar(self._status)
+                    tkmessagebox.showinfo("Info", "Login succesful")
+                else:
+                    print("Login failed")
+                    tkmessagebox.showinfo("Error", "Login failed")
+
+            self.run_in_background("Logging in",
+                                   lambda cancel: api.login(login_dialog.username, login_dialog.password),
+                                   login_done)
 
     def logout(self):
         print("Logging out... ")
-        try:
-            self.kicktipp_api.logout()
+
+        def logout_done(result):
             print("Done.")
-            self.set_statusbar("Offline")
-        except AttributeError:
-            print("Not possible.")
+            self._status = "Offline"
+            self.set_statusbar(self._status)
+
+        def logout(cancel):
+            try:
+                self.kicktipp_api.logout()
+            except AttributeError:
+                print("Not possible.")
+
+        self.run_in_background("Logging out", logout, logout_done)
 
     def fetch_games(self):
         print("Fetching match day... ")
-        games = self.kicktipp_api.fetch_games()
-        if games is not None:
-            for kk in range(len(games)):
-                self.main_view.main_widgets.v_team_list[2*kk].set(games[kk][0])
-                self.main_view.main_widgets.v_team_list[2*kk+1].set(games[kk][1])
-        print("Done.")
+
+        def fetch_done(games):
+            if games is not None:
+                for kk, (team1, team2) in enumerate(zip(games['team1'], games['team2'])):
+                    self.main_view.main_widgets.v_team_list[2*kk].set(team1)
+                    self.main_view.main_widgets.v_team_list[2*kk+1].set(team2)
+            print("Done.")
+
+        self.run_in_background("Fetching match day", lambda cancel: self.kicktipp_api.read_games(), fetch_done)
 
     def submit_scores(self):
         print("Submit scores... ")
         self.update_scores()  # read values from the GUI before submitting
-        self.kicktipp_api.submit_scores(self.model.scores)
-        print("Done.")
+        scores = [list(score) for score in self.model.scores]  # copy: the worker must not read the Tk variables
+
+        def submit(cancel):
+            # two steps (read the tippabgabe page, submit the changed tipps), so it can be cancelled in between
+            if self.kicktipp_api.read_tipps() is None or cancel.is_set():
+                return None
+            return self.kicktipp_api.submit_predictions(scores, refresh=False)
+
+        self.run_in_background("Submitting scores", submit, lambda result: print("Done."))
+
+    def close(self):
+        """ Cancels the running background task and stops the worker thread """
+        self.cancel()
+        self._executor.shutdown(wait=False)
 
     def update_scores(self):
         for kk in range(9):
@@ -228,4 +348,5 @@ if __name__ == '__main__':
 
     app = Controller(root)
     root.mainloop()
+    app.close()
 
@@ -0,0 +1,168 @@
+import numpy as np
+import os
+
+from . import predictor
+
+
+class PredictionTable:
+    """ Precomputed predicted scores and tendency probabilities on a grid of projected scores (l1, l2).
+
+    The projected scores of FiveThirtyEight are given to two decimals and the predicted score and the tendency
+    probabilities of MatchPredictor only depend on l1, l2 and n_bins. So they are computed once for the whole grid
+    0, step, 2*step, ..., l_max and stored in .npy files, which are memory-mapped. Lookups on the grid cost O(1);
+    projected scores off the grid (or above l_max) are computed with MatchPredictor.
+
+    The file names contain VERSION and the grid parameters, so tables of a previous version or with other parameters
+    are not used.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the table files
+    l_max : float
+        Largest projected score of the grid
+    step : float
+        Step size of the grid
+    n_bins : int
+        Number of bins of the Poisson distributions, see MatchPredictor
+    """
+
+    VERSION = 2
+
+    def __init__(self, path='../data/prediction_table', l_max=5.0, step=0.01, n_bins=8):
+        self.path = path
+        self.l_max = l_max
+        self.step = step
+        self.n_bins = n_bins
+
+        self._pred = predictor.MatchPredictor()
+        self._scores = None
+        self._score_probs = None
+        self._probs_tendency = None
+
+    @property
+    def n_grid(self):
+        """int: Number of grid points per team"""
+        return int(round(self.l_max/self.step)) + 1
+
+    @property
+    def grid(self):
+        """nd.array: Projected scores of the grid points"""
+        return np.round(np.arange(self.n_grid)*self.step, 10)
+
+    def _filename(self, name):
+        return os.path.join(self.path, 'prediction_table_v{}_bins{}_step{}_max{}_{}.npy'.format(
+            self.VERSION, self.n_bins, self.step, self.l_max, name))
+
+    def build(self, chunk_size=50):
+        """ Computes the table and writes it to the .npy files.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Number of grid values of l1 computed at once (limits the memory for the score probabilities)
+
+        Returns
+        -------
+        PredictionTable
+            self
+        """
+        if not os.path.isdir(self.path):  # create directory if it does not exist
+            os.makedirs(self.path)
+
+        grid = self.grid
+        n = self.n_grid
+        scores = np.zeros((n, n, 2), dtype=np.int8)
+        score_probs = np.zeros((n, n))
+        probs_tendency = np.zeros((n, n, 3))
+        for start in range(0, n, chunk_size):
+            l1, l2 = np.meshgrid(grid[start:start + chunk_size], grid, indexing='ij')
+            probs = self._pred.calculate_score_probs_batch(l1.ravel(), l2.ravel(), self.n_bins, rho=0)
+            chunk_scores, chunk_score_probs = self._pred.predicted_score_batch(probs)
+            scores[start:start + chunk_size] = chunk_scores.reshape(l1.shape + (2,))
+            score_probs[start:start + chunk_size] = chunk_score_probs.reshape(l1.shape)
+            probs_tendency[start:start + chunk_size] = self._pred.probs_tendency_batch(probs).reshape(l1.shape + (3,))
+
+        # write to temporary files first, so readers never see incomplete tables
+        for name, values in (('scores', scores), ('score_probs', score_probs), ('probs_tendency', probs_tendency)):
+            filename = self._filename(name)
+            np.save(filename + '.tmp.npy', values)
+            os.replace(filename + '.tmp.npy', filename)
+
+        self._scores = self._score_probs = self._probs_tendency = None
+        return self
+
+    def load(self, build=True):
+        """ Memory-maps the table files.
+
+        Parameters
+        ----------
+        build : bool
+            If True (default), the table is built if the files do not exist.
+
+        Returns
+        -------
+        PredictionTable
+            self
+        """
+        if build and not all(os.path.isfile(self._filename(name))
+                             for name in ('scores', 'score_probs', 'probs_tendency')):
+            self.build()
+        self._scores = np.load(self._filename('scores'), mmap_mode='r')
+        self._score_probs = np.load(self._filename('score_probs'), mmap_mode='r')
+        self._probs_tendency = np.load(self._filename('probs_tendency'), mmap_mode='r')
+        return self
+
+    def grid_index(self, l):
+        """ Returns the grid indices of projected scores and a mask of the values on the grid
+
+        Parameters
+        ----------
+        l : array_like
+            Projected scores
+
+        Returns
+        -------
+        nd.array, nd.array
+            Grid indices (0 for values off the grid) and boolean mask (True: value is on the grid)
+        """
+        l = np.atleast_1d(np.asarray(l, dtype=float))
+        idx = np.rint(l/self.step)
+        on_grid = (np.abs(idx*self.step - l) < 1e-6) & (idx >= 0) & (idx < self.n_grid)
+        return np.where(on_grid, idx, 0).astype(np.intp), on_grid
+
+    def predict(self, l1, l2):
+        """ Returns the predicted scores and tendency probabilities of many matches.
+
+        Parameters
+        ----------
+        l1 : array_like
+            Projected scores for team 1, one element per match
+        l2 : array_like
+            Projected scores for team 2, one element per match
+
+        Returns
+        -------
+        nd.array, nd.array, nd.array
+            Predicted scores with shape (number of matches, 2), probabilities of these scores and tendency probabilities
+            with shape (number of matches, 3), see MatchPredictor.predicted_score_batch and probs_tendency_batch
+        """
+        if self._scores is None:
+            self.load()
+        l1 = np.atleast_1d(np.asarray(l1, dtype=float))
+        l2 = np.atleast_1d(np.asarray(l2, dtype=float))
+        i, on_grid1 = self.grid_index(l1)
+        j, on_grid2 = self.grid_index(l2)
+        on_grid = on_grid1 & on_grid2
+
+        scores = np.asarray(self._scores[i, j], dtype=int)
+        score_probs = np.asarray(self._score_probs[i, j])
+        probs_tendency = np.asarray(self._probs_tendency[i, j])
+
+        if not np.all(on_grid):  # fallback: compute the values off the grid
+            off_grid = ~on_grid
+            probs = self._pred.calculate_score_probs_batch(l1[off_grid], l2[off_grid], self.n_bins, rho=0)
+            scores[off_grid], score_probs[off_grid] = self._pred.predicted_score_batch(probs)
+            probs_tendency[off_grid] = self._pred.probs_tendency_batch(probs)
+
+        return scores, score_probs, probs_tendency
@@ -0,0 +1,144 @@
+import numpy as np
+from scipy import stats
+
+
+def remove_overround(odds, method='proportional', n_iter=60):
+    """ Converts bookmaker's odds to probabilities by removing the overround (the bookmaker's margin).
+
+    Parameters
+    ----------
+    odds : array_like
+        Decimal odds with shape (number of matches, number of outcomes), e.g. the columns odds_win1, odds_draw,
+        odds_win2 from KicktippAPI.read_games
+    method : str, {'proportional' (default), 'shin', 'power'}
+        'proportional': the implied probabilities 1/odds are scaled to sum to 1.
+        'shin': Shin's model, which assumes that the margin protects the bookmaker against insider trading. Removes
+        more margin from longshots than from favourites.
+        'power': the implied probabilities are raised to the power k, with k chosen such that they sum to 1.
+    n_iter : int
+        Number of iterations for the methods 'shin' and 'power'
+
+    Returns
+    -------
+    nd.array
+        Probabilities with the same shape as odds
+
+    See: Shin. "Measuring the incidence of insider trading in a market for state-contingent claims."
+    The Economic Journal 103.420 (1993): 1141-1153.
+    """
+    implied = 1/np.atleast_2d(np.asarray(odds, dtype=float))
+    booksum = np.sum(implied, axis=1, keepdims=True)
+
+    if method == 'proportional':
+        return implied/booksum
+
+    elif method == 'shin':
+        # Find the share of insider trading z by bisection, such that the probabilities sum to 1
+        def shin_probs(z):
+            return (np.sqrt(z**2 + 4*(1 - z)*implied**2/booksum) - z)/(2*(1 - z))
+
+        z_low = np.zeros_like(booksum)
+        z_high = np.full_like(booksum, 0.5)
+        for _ in range(n_iter):
+            z = (z_low + z_high)/2
+            too_high = np.sum(shin_probs(z), axis=1, keepdims=True) > 1
+            z_low = np.where(too_high, z, z_low)
+            z_high = np.where(too_high, z_high, z)
+        return shin_probs((z_low + z_high)/2)
+
+    elif method == 'power':
+        # Newton iterations for the exponent k: sum(implied**k) = 1
+        log_implied = np.log(implied)
+        k = np.ones_like(booksum)
+        for _ in range(n_iter):
+            powered = implied**k
+            step = (np.sum(powered, axis=1, keepdims=True) - 1)/np.sum(powered*log_implied, axis=1, keepdims=True)
+            k = k - step
+            if np.max(np.abs(step)) < 1e-12:
+                break
+        return implied**k
+
+    else:
+        raise(ValueError('Invalid value for "method".'))
+
+
+def lambdas_from_probabilities(probs_tendency, n_goals=20, n_iter=50, tol=1e-9):
+    """ Finds the expectation values (l1, l2) of independent Poisson distributions matching tendency probabilities.
+
+    All matches are solved at once with damped Gauss-Newton iterations in log(l1), log(l2). If the probabilities are
+    not exactly reachable by independent Poisson distributions, the least squares solution is returned.
+
+    Parameters
+    ----------
+    probs_tendency : array_like
+        Probabilities with shape (number of matches, 3) in the order [team 1 wins, draw, team 2 wins] (the order of
+        the odds on kicktipp)
+    n_goals : int
+        Number of goals per team considered in the calculation
+    n_iter : int
+        Maximum number of iterations
+    tol : float
+        The iterations stop when all residuals are below tol
+
+    Returns
+    -------
+    nd.array, nd.array
+        Expectation values l1 and l2
+    """
+    probs = np.atleast_2d(np.asarray(probs_tendency, dtype=float))
+    probs = probs/np.sum(probs, axis=1, keepdims=True)
+
+    goals = np.arange(n_goals)
+    goal_difference = np.subtract.outer(goals, goals)
+    # outcome masks, same order as probs: team 1 wins, draw, team 2 wins
+    masks = np.stack([goal_difference > 0, goal_difference == 0, goal_difference < 0], axis=-1).reshape(-1, 3)
+    masks = masks.astype(float)
+
+    # start values: 2.7 goals in total, split according to the win probabilities
+    share = (probs[:, 0] + probs[:, 1]/2)
+    log_l = np.log(np.stack([2.7*share, 2.7*(1 - share)], axis=1).clip(0.05))
+
+    for _ in range(n_iter):
+        l1, l2 = np.exp(log_l[:, 0]), np.exp(log_l[:, 1])
+        pmf1 = stats.poisson.pmf(goals, l1[:, np.newaxis])
+        pmf2 = stats.poisson.pmf(goals, l2[:, np.newaxis])
+        # derivative of the pmf with respect to log(l): l * (pmf(k-1) - pmf(k)) = pmf(k) * (k - l)
+        dpmf1 = pmf1*(goals - l1[:, np.newaxis])
+        dpmf2 = pmf2*(goals - l2[:, np.newaxis])
+
+        p = _outer(pmf1, pmf2) @ masks
+        residual = p - probs
+        if np.max(np.abs(residual)) < tol:
+            break
+        jacobian = np.stack([_outer(dpmf1, pmf2) @ masks, _outer(pmf1, dpmf2) @ masks], axis=2)
+
+        # solve the normal equations (J^T J) step = -J^T r of each match
+        jtj = np.einsum('noa,nob->nab', jacobian, jacobian)
+        jtr = np.einsum('noa,no->na', jacobian, residual)
+        step = -np.linalg.solve(jtj + 1e-12*np.eye(2), jtr[:, :, np.newaxis])[:, :, 0]
+        log_l = log_l + np.clip(step, -1, 1)
+
+    return np.exp(log_l[:, 0]), np.exp(log_l[:, 1])
+
+
+def _outer(a, b):
+    """ Outer products of the rows of a and b, flattened: shape (number of rows, a.shape[1] * b.shape[1]) """
+    return (a[:, :, np.newaxis]*b[:, np.newaxis, :]).reshape(len(a), -1)
+
+
+def lambdas_from_odds(odds, method='proportional'):
+    """ Expectation values (l1, l2) implied by bookmaker's odds.
+
+    Parameters
+    ----------
+    odds : array_like
+        Decimal odds with shape (number of matches, 3) in the order [team 1 wins, draw, team 2 wins]
+    method : str
+        Method to remove the overround, see remove_overround
+
+    Returns
+    -------
+    nd.array, nd.array
+        Expectation values l1 and l2
+    """
+    return lambdas_from_probabilities(remove_overround(odds, method))
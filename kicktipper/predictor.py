@@ -2,6 +2,9 @@ import numpy as np
 from scipy import stats
 import matplotlib.pyplot as plt
 
+# Tendencies tipped if the probabilities of team 1 wins and team 2 wins are tied, see MatchPredictor.tie_break
+TIE_BREAKS = ('team1', 'team2', 'draw')
+
 
 class MatchPredictor:
     """ Class to calculates the probabilities for different scores (outcomes) of two teams.
@@ -12,13 +15,61 @@ class MatchPredictor:
         Projected score for team 1 (expectation value for Poisson distribution)
     l2 : float
         Projected score for team 2 (expectation value for Poisson distribution)
+    rho : float
+        Dixon-Coles correlation parameter for low scores (0:0, 0:1, 1:0, 1:1). 0 (default) means independent scores.
+    table : lookup.PredictionTable
+        Optional table of precomputed predictions. If set, predicted_score, probs_tendency and predict_batch are
+        answered from the table (if rho and the dispersions are 0 and the number of bins matches).
+    dispersion1 : float
+        Uncertainty of l1: the expectation value is Gamma distributed with mean l1 and variance dispersion1*l1**2, so
+        the goals follow a negative binomial distribution with variance l1 + dispersion1*l1**2 (see goals_pmf).
+        0 (default) means l1 is exact (Poisson distribution).
+    dispersion2 : float
+        Uncertainty of l2, see dispersion1
+    tie_break : str
+        Tendency tipped if team 1 wins and team 2 wins are tied as most likely tendencies (e.g. for l1 == l2), one of
+        TIE_BREAKS: 'team1' (default), 'team2' or 'draw'
     """
 
-    def __init__(self, l1=0.0, l2=0):
+    # Probabilities which differ by less than this relative tolerance are ties (e.g. the tendencies team 1 wins and
+    # team 2 wins for l1 == l2, which differ only by rounding errors). Ties are broken by a fixed order, see _argmax.
+    TIE_RTOL = 1e-9
+
+    def __init__(self, l1=0.0, l2=0, rho=0.0, table=None, dispersion1=0.0, dispersion2=0.0, tie_break='team1'):
         self._poisson_n_bins = 8
 
         self.l1 = l1
         self.l2 = l2
+        self.rho = rho
+        self.table = table
+        self.dispersion1 = dispersion1
+        self.dispersion2 = dispersion2
+        self.tie_break = tie_break
+
+    def _use_table(self):
+        return (self.table is not None and self.rho == 0 and self.dispersion1 == 0 and self.dispersion2 == 0
+                and self.table.n_bins == self._poisson_n_bins and self.tie_break == 'team1')
+
+    @classmethod
+    def _argmax(cls, values, axis=-1):
+        """ Index of the maximum along an axis. Values within TIE_RTOL of the maximum count as ties, the first of them
+        (lowest index) is returned. Used by predicted_score and predicted_score_batch, so both break ties the same way.
+        """
+        values = np.asarray(values)
+        best = np.isclose(values, np.max(values, axis=axis, keepdims=True), rtol=cls.TIE_RTOL, atol=0)
+        return np.argmax(best, axis=axis)
+
+    @classmethod
+    def _most_likely_tendency(cls, probs_tendency, tie_break='team1'):
+        """ Most likely tendencies (0: team 1 wins, 1: team 2 wins, 2: draw) for tendency probabilities with shape
+        (..., 3). Ties are broken in the order team 1 wins, team 2 wins, draw; tie_break replaces team 1 wins if it is
+        tied with team 2 wins.
+        """
+        probs_tendency = np.asarray(probs_tendency)
+        tendency = cls._argmax(probs_tendency, axis=-1)
+        wins_tied = (tendency == 0) & np.isclose(probs_tendency[..., 1], probs_tendency[..., 0], rtol=cls.TIE_RTOL,
+                                                 atol=0)
+        return np.where(wins_tied, TIE_BREAKS.index(tie_break), tendency)
 
     def poisson_pmf(self, l, n_bins=None):
         """ Returns the probablity mass function of the Poissonian distribution with average number l
@@ -26,20 +77,69 @@ class MatchPredictor:
 
         Parameters
         ----------
-        l : float
+        l : float or array_like
             Average number of events per interval ("shape parameter")
         n_bins : int
             Number of bins. If None (default), the value from the class attribute _poisson_n_bins is used.
 
         Returns
         -------
-        Probability mass function of Poisson distribution
+        Probability mass function of Poisson distribution. If l is an array, the pmf is calculated for each element of
+        l and the bins are stored along an additional last axis.
         """
         if n_bins is None:
             n_bins = self._poisson_n_bins
 
         n = np.arange(0, n_bins)
-        return stats.poisson.pmf(n, l)
+        # trailing axis for the goals, so an array of l returns one pmf per row
+        return stats.poisson.pmf(n, np.asarray(l)[..., np.newaxis])
+
+    def negative_binomial_pmf(self, l, dispersion, n_bins=None):
+        """ Returns the probability mass function of a Poisson distribution whose expectation value is Gamma distributed
+        with mean l and variance dispersion*l**2 (Gamma-Poisson mixture). This is a negative binomial distribution
+        with mean l and variance l + dispersion*l**2.
+        See https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.nbinom.html
+
+        Parameters
+        ----------
+        l : float or array_like
+            Expectation value
+        dispersion : float or array_like
+            Dispersion (> 0), broadcastable to l
+        n_bins : int
+            Number of bins. If None (default), the value from the class attribute _poisson_n_bins is used.
+
+        Returns
+        -------
+        Probability mass function, same shape as returned by poisson_pmf
+        """
+        if n_bins is None:
+            n_bins = self._poisson_n_bins
+
+        n = np.arange(0, n_bins - 1)
+        l = np.asarray(l, dtype=float)[..., np.newaxis]
+        dispersion = np.asarray(dispersion, dtype=float)[..., np.newaxis]
+        # scipy parametrization: number of successes r = 1/dispersion, success probability 1/(1 + dispersion*l)
+        # The pmf is calculated with the recursion pmf(k+1) = pmf(k) * (k + r)/(k + 1) * dispersion*l/(1 + dispersion*l)
+        # (cheaper than stats.nbinom.pmf, which evaluates the gamma functions for every bin).
+        r = 1/dispersion
+        q = dispersion*l/(1 + dispersion*l)
+        pmf0 = np.exp(-r*np.log1p(dispersion*l))
+        ratios = (n + r)/(n + 1)*q
+        return np.concatenate([pmf0, pmf0*np.cumprod(ratios, axis=-1)], axis=-1)
+
+    def goals_pmf(self, l, dispersion=0.0, n_bins=None):
+        """ Returns the probability mass function of the goals: Poisson distribution for dispersion 0, negative binomial
+        distribution (see negative_binomial_pmf) otherwise. dispersion may be an array, with 0 for exact expectation
+        values.
+        """
+        dispersion = np.asarray(dispersion, dtype=float)
+        if not np.any(dispersion > 0):
+            return self.poisson_pmf(l, n_bins)
+
+        uncertain = np.broadcast_to(dispersion > 0, np.shape(l))[..., np.newaxis]
+        return np.where(uncertain, self.negative_binomial_pmf(l, np.where(dispersion > 0, dispersion, 1), n_bins),
+                        self.poisson_pmf(l, n_bins))
 
     def calculate_score_probs(self, mode='all'):
         """ Calculates the probabilities for different scores (outcomes) of two teams. The required information is
@@ -60,10 +160,12 @@ class MatchPredictor:
 
 
         """
-        y1 = self.poisson_pmf(self.l1)
-        y2 = self.poisson_pmf(self.l2)
+        y1 = self.goals_pmf(self.l1, self.dispersion1)
+        y2 = self.goals_pmf(self.l2, self.dispersion2)
 
         score_probs = np.tensordot(y1, y2, axes=0)  # vector * vector => matrix
+        if self.rho != 0:
+            score_probs = self.dixon_coles_correction(score_probs, self.l1, self.l2, self.rho)
         if mode == 'all':
             pass
         elif mode == 'draws':
@@ -122,6 +224,9 @@ class MatchPredictor:
         list with 3 elements
             [probability team 1 wins, probability team 2 wins, probabilty for a draw]
         """
+        if self._use_table():
+            return self.table.predict(self.l1, self.l2)[2][0].tolist()
+
         p_team1 = np.sum(self.calculate_score_probs(mode='team1_wins'))
         p_team2 = np.sum(self.calculate_score_probs(mode='team2_wins'))
         p_draw = np.sum(self.calculate_score_probs(mode='draws'))
@@ -158,7 +263,8 @@ class MatchPredictor:
         for idx, d in enumerate(d_ar):
             prob[idx] = self.prob_goal_difference(d, mode)
 
-        return d_ar[np.argmax(prob)], np.max(prob)
+        idx = self._argmax(prob)
+        return d_ar[idx], prob[idx]
 
     def most_likely_score(self, d=None, mode='all'):
         """ Returns the most likely score.
@@ -181,18 +287,47 @@ class MatchPredictor:
             # Set all elements except the diagonal offset by -d to zero
             # Remaining non-zero elements correspond to results with a goal difference of d.
             score_probs = np.diag(np.diag(score_probs, k=-d), k=-d)
-        result = list(np.unravel_index(np.argmax(score_probs), score_probs.shape))  # gets the indicies with the highest
+        idx = self._argmax(score_probs.ravel())
+        result = list(np.unravel_index(idx, score_probs.shape))  # gets the indicies with the highest
         # probability inside score_probs as list.
         # See: https://stackoverflow.com/questions/9482550/argmax-of-numpy-array-returning-non-flat-indices
 
-        prob = np.max(score_probs)
+        prob = score_probs.ravel()[idx]
 
         return result, prob
 
+    def top_scores(self, k=5, d=None, mode='all'):
+        """ Returns the k most likely scores, ordered by probability.
+        Parameters "mode" and "d" set further constrains on the subset of score probabilites to be considered, see
+        most_likely_score.
+
+        Parameters
+        ----------
+        k : int
+            Number of scores
+        d : int
+            Goal difference. Positive: team 1 wins, negative: team 2 wins, 0: draw
+        mode : str
+            Passed to call of calculate_score_probs. See definition there.
+
+        Returns
+        -------
+        list of tuple
+            ([result], probability) for each score, e.g. [([1, 1], 0.12), ([1, 0], 0.11), ...]
+        """
+        score_probs = self.calculate_score_probs(mode=mode)[np.newaxis]
+        scores, probs = self.top_scores_batch(score_probs, k, d=d)
+        return [(score, prob) for score, prob in zip(scores[0].tolist(), probs[0].tolist())]
+
     @property
     def predicted_score(self):
-        # 1) Calculate most likely tendency
-        tendency = np.argmax(self.probs_tendency)  # 0: team 1 wins, 1: team 2 wins, 2: draw
+        if self._use_table():
+            scores, probs, _ = self.table.predict(self.l1, self.l2)
+            return scores[0].tolist(), probs[0]
+
+        # 1) Calculate most likely tendency, ties are broken as given by tie_break
+        tendency = self._most_likely_tendency(self.probs_tendency, self.tie_break)  # 0: team 1 wins, 1: team 2 wins,
+        # 2: draw
 
         # 2) What is the most likely goal difference within the tendency
         if tendency == 0:
@@ -207,3 +342,215 @@ class MatchPredictor:
 
         # 3) What is the most likely result with the predicted goal difference?
         return self.most_likely_score(d=d, mode=mode)
+
+    def calculate_score_probs_batch(self, l1, l2, n_bins=None, rho=None, dispersion1=None, dispersion2=None):
+        """ Calculates the score probabilities for many matches at once.
+
+        Vectorized version of calculate_score_probs (mode 'all').
+
+        Parameters
+        ----------
+        l1 : array_like
+            Projected scores for team 1, one element per match
+        l2 : array_like
+            Projected scores for team 2, one element per match
+        n_bins : int
+            Number of bins. If None (default), the value from the class attribute _poisson_n_bins is used.
+        rho : float or array_like
+            Dixon-Coles correlation parameter(s). If None (default), the class attribute rho is used.
+        dispersion1 : float or array_like
+            Uncertainty of l1, one value for all matches or one per match. If None (default), the class attribute
+            dispersion1 is used.
+        dispersion2 : float or array_like
+            Uncertainty of l2, see dispersion1
+
+        Returns
+        -------
+        nd.array
+            Array with shape (number of matches, n_bins, n_bins). score_probs[k, 2, 1] gives the probability for the
+            score of match k being 2:1
+        """
+        if rho is None:
+            rho = self.rho
+        if dispersion1 is None:
+            dispersion1 = self.dispersion1
+        if dispersion2 is None:
+            dispersion2 = self.dispersion2
+        l1 = np.atleast_1d(l1)
+        l2 = np.atleast_1d(l2)
+        y1 = self.goals_pmf(l1, dispersion1, n_bins)
+        y2 = self.goals_pmf(l2, dispersion2, n_bins)
+
+        score_probs = y1[:, :, np.newaxis] * y2[:, np.newaxis, :]
+        if np.any(rho != 0):
+            score_probs = self.dixon_coles_correction(score_probs, l1, l2, rho)
+        return score_probs
+
+    @staticmethod
+    def dixon_coles_correction(score_probs, l1, l2, rho):
+        """ Applies the Dixon-Coles correction for low scores to score probabilities of independent Poisson
+        distributions.
+
+        See: Dixon, Coles. "Modelling association football scores and inefficiencies in the football betting market."
+        Journal of the Royal Statistical Society: Series C 46.2 (1997): 265-280.
+
+        Parameters
+        ----------
+        score_probs : nd.array
+            Score probabilities, last two axes for the goals of team 1 and team 2
+        l1 : float or nd.array
+            Projected score(s) for team 1, broadcastable to score_probs.shape[:-2]
+        l2 : float or nd.array
+            Projected score(s) for team 2
+        rho : float or nd.array
+            Correlation parameter(s)
+
+        Returns
+        -------
+        nd.array
+            Corrected score probabilities
+        """
+        l1, l2, rho = np.asarray(l1), np.asarray(l2), np.asarray(rho)
+        score_probs = np.array(score_probs, dtype=float)
+        score_probs[..., 0, 0] *= 1 - l1*l2*rho
+        score_probs[..., 0, 1] *= 1 + l1*rho
+        score_probs[..., 1, 0] *= 1 + l2*rho
+        score_probs[..., 1, 1] *= 1 - rho
+        return score_probs
+
+    @staticmethod
+    def probs_tendency_batch(score_probs):
+        """ Calculates the probabilities for the tendency of many matches at once.
+
+        Parameters
+        ----------
+        score_probs : nd.array
+            Score probabilities with shape (number of matches, n_bins, n_bins), see calculate_score_probs_batch
+
+        Returns
+        -------
+        nd.array
+            Array with shape (number of matches, 3). Columns are in the same order as in probs_tendency:
+            [probability team 1 wins, probability team 2 wins, probabilty for a draw]
+        """
+        n_bins = score_probs.shape[-1]
+        goal_difference = np.subtract.outer(np.arange(n_bins), np.arange(n_bins))
+        p_team1 = np.sum(score_probs, axis=(1, 2), where=goal_difference > 0)
+        p_team2 = np.sum(score_probs, axis=(1, 2), where=goal_difference < 0)
+        p_draw = np.trace(score_probs, axis1=1, axis2=2)
+
+        return np.stack([p_team1, p_team2, p_draw], axis=1)
+
+    @classmethod
+    def predicted_score_batch(cls, score_probs, tie_break='team1'):
+        """ Calculates the predicted score (see predicted_score) for many matches at once.
+
+        The same rules as in predicted_score are applied. Ties (see TIE_RTOL) are broken in the same fixed order: team
+        1 wins before team 2 wins before draw (tied wins: see tie_break), then the lowest goal difference and the lowest
+        score index.
+
+        Parameters
+        ----------
+        score_probs : nd.array
+            Score probabilities with shape (number of matches, n_bins, n_bins), see calculate_score_probs_batch
+        tie_break : str
+            See MatchPredictor.tie_break
+
+        Returns
+        -------
+        nd.array, nd.array
+            Predicted scores with shape (number of matches, 2) and the probabilities of these scores
+        """
+        n_matches, n_bins = score_probs.shape[0], score_probs.shape[-1]
+        goal_difference = np.subtract.outer(np.arange(n_bins), np.arange(n_bins))
+
+        # 1) Calculate most likely tendency (0: team 1 wins, 1: team 2 wins, 2: draw)
+        tendency = cls._most_likely_tendency(cls.probs_tendency_batch(score_probs), tie_break)
+
+        # 2) What is the most likely goal difference within the tendency
+        # Scores outside of the tendency are set to zero, see calculate_score_probs
+        in_tendency = np.stack([goal_difference > 0, goal_difference < 0, goal_difference == 0])[tendency]
+        score_probs = np.where(in_tendency, score_probs, 0)
+        # one-hot matrix mapping each score to its goal difference (-(n_bins-1), ..., n_bins-1)
+        d_ar = np.arange(-(n_bins-1), n_bins)
+        d_onehot = (goal_difference.reshape(-1, 1) == d_ar).astype(score_probs.dtype)
+        prob_d = score_probs.reshape(n_matches, -1) @ d_onehot
+        d = d_ar[cls._argmax(prob_d, axis=1)]
+
+        # 3) What is the most likely result with the predicted goal difference?
+        score_probs = np.where(goal_difference == d[:, np.newaxis, np.newaxis], score_probs, 0).reshape(n_matches, -1)
+        idx = cls._argmax(score_probs, axis=1)
+        scores = np.stack(np.unravel_index(idx, (n_bins, n_bins)), axis=1)
+
+        return scores, score_probs[np.arange(n_matches), idx]
+
+    def predict_batch(self, l1, l2):
+        """ Calculates the predicted scores and the tendency probabilities for many matches at once.
+
+        If self.table is set (and rho is 0), the values are looked up in the table, otherwise they are computed with
+        calculate_score_probs_batch, predicted_score_batch and probs_tendency_batch.
+
+        Parameters
+        ----------
+        l1 : array_like
+            Projected scores for team 1, one element per match
+        l2 : array_like
+            Projected scores for team 2, one element per match
+
+        Returns
+        -------
+        nd.array, nd.array, nd.array
+            Predicted scores with shape (number of matches, 2), probabilities of these scores and tendency probabilities
+            with shape (number of matches, 3)
+        """
+        if self._use_table():
+            return self.table.predict(l1, l2)
+        score_probs = self.calculate_score_probs_batch(l1, l2)
+        scores, probs = self.predicted_score_batch(score_probs, self.tie_break)
+        return scores, probs, self.probs_tendency_batch(score_probs)
+
+    @staticmethod
+    def top_scores_batch(score_probs, k=5, tendency=None, d=None):
+        """ Returns the k most likely scores of many matches, ordered by probability.
+
+        Only the k largest probabilities of each match are selected (partial sort with numpy.argpartition) and sorted.
+
+        Parameters
+        ----------
+        score_probs : nd.array
+            Score probabilities with shape (number of matches, n_bins, n_bins), see calculate_score_probs_batch
+        k : int
+            Number of scores per match
+        tendency : int or array_like, optional
+            Only scores with this tendency are considered (0: team 1 wins, 1: team 2 wins, 2: draw, as in
+            probs_tendency). One value for all matches or one per match.
+        d : int or array_like, optional
+            Only scores with this goal difference are considered. One value for all matches or one per match.
+
+        Returns
+        -------
+        nd.array, nd.array
+            Scores with shape (number of matches, k, 2) and their probabilities with shape (number of matches, k).
+            Excluded scores have the probability 0, so they are only returned if fewer than k scores are left.
+        """
+        n_matches, n_bins = score_probs.shape[0], score_probs.shape[-1]
+        k = min(k, n_bins*n_bins)
+        goal_difference = np.subtract.outer(np.arange(n_bins), np.arange(n_bins))
+
+        if tendency is not None:
+            in_tendency = np.stack([goal_difference > 0, goal_difference < 0, goal_difference == 0])
+            tendency = np.broadcast_to(tendency, (n_matches,))
+            score_probs = np.where(in_tendency[tendency], score_probs, 0)
+        if d is not None:
+            d = np.broadcast_to(d, (n_matches,))
+            score_probs = np.where(goal_difference == d[:, np.newaxis, np.newaxis], score_probs, 0)
+
+        flat = score_probs.reshape(n_matches, -1)
+        idx = np.argpartition(-flat, k - 1, axis=1)[:, :k]
+        probs = np.take_along_axis(flat, idx, axis=1)
+        order = np.argsort(-probs, axis=1, kind='stable')
+        idx = np.take_along_axis(idx, order, axis=1)
+        probs = np.take_along_axis(probs, order, axis=1)
+
+        scores = np.stack(np.unravel_index(idx, (n_bins, n_bins)), axis=-1)
+        return scores, probs
@@ -0,0 +1,172 @@
+import numpy as np
+import math
+
+from . import predictor
+
+
+class PoissonRatings:
+    """ Online team ratings, updated after every result.
+
+    The model is the same as in DixonColes without the low-score correction: the expected scores are
+    l1 = exp(intercept + home_advantage + attack[team1] + defense[team2])
+    l2 = exp(intercept + attack[team2] + defense[team1])
+    After each result, the parameters of the two teams take one gradient step on the Poisson log-likelihood of that
+    result (similar to an Elo update), so ingesting a result costs O(1) regardless of the number of matches played.
+    intercept and home_advantage are updated with a smaller learning rate.
+
+    Attributes
+    ----------
+    learning_rate : float
+        Step size for the team parameters
+    global_learning_rate : float
+        Step size for intercept and home_advantage
+    season_regression : float
+        Fraction by which all team parameters are shrunk towards zero when a new season starts
+    intercept : float
+    home_advantage : float
+    """
+
+    def __init__(self, learning_rate=0.04, global_learning_rate=0.001, season_regression=0.2):
+        self.learning_rate = learning_rate
+        self.global_learning_rate = global_learning_rate
+        self.season_regression = season_regression
+
+        self.intercept = 0.3
+        self.home_advantage = 0.25
+
+        self._team_index = {}
+        self._attack = []
+        self._defense = []
+        self._season = None
+
+    @property
+    def teams(self):
+        """list: Team names (order of attack and defense)"""
+        return list(self._team_index)
+
+    @property
+    def attack(self):
+        return np.array(self._attack)
+
+    @property
+    def defense(self):
+        return np.array(self._defense)
+
+    def _index(self, team):
+        idx = self._team_index.get(team)
+        if idx is None:  # new teams start with average ratings
+            idx = self._team_index[team] = len(self._attack)
+            self._attack.append(0.0)
+            self._defense.append(0.0)
+        return idx
+
+    def new_season(self, season=None):
+        """ Shrinks all team parameters towards zero by season_regression """
+        factor = 1 - self.season_regression
+        self._attack = [a*factor for a in self._attack]
+        self._defense = [d*factor for d in self._defense]
+        self._season = season
+
+    def update(self, team1, team2, score1, score2):
+        """ Updates the ratings of two teams with a result.
+
+        Returns
+        -------
+        float, float
+            Expected scores l1 and l2 before the update
+        """
+        i = self._index(team1)
+        j = self._index(team2)
+        attack, defense = self._attack, self._defense
+
+        l1 = math.exp(self.intercept + self.home_advantage + attack[i] + defense[j])
+        l2 = math.exp(self.intercept + attack[j] + defense[i])
+        e1 = score1 - l1
+        e2 = score2 - l2
+
+        attack[i] += self.learning_rate*e1
+        defense[j] += self.learning_rate*e1
+        attack[j] += self.learning_rate*e2
+        defense[i] += self.learning_rate*e2
+        self.home_advantage += self.global_learning_rate*e1
+        self.intercept += self.global_learning_rate*(e1 + e2)
+
+        return l1, l2
+
+    def ingest(self, data):
+        """ Updates the ratings with a sequence of results, e.g. the full history of a league.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Results in chronological order with the columns 'team1', 'team2', 'score1', 'score2' and optionally
+            'season' (see FiveThirtyEight.data). Matches without scores are skipped. A change of 'season' calls
+            new_season.
+
+        Returns
+        -------
+        nd.array, nd.array
+            Expected scores l1 and l2 of each match, as they stood before the match (NaN for skipped matches). These
+            are out-of-sample predictions, suitable for backtests.
+        """
+        seasons = data['season'].values if 'season' in data else [self._season]*len(data)
+        l1 = np.full(len(data), np.nan)
+        l2 = np.full(len(data), np.nan)
+        rows = zip(seasons, data['team1'].values, data['team2'].values, data['score1'].values, data['score2'].values)
+        for k, (season, team1, team2, score1, score2) in enumerate(rows):
+            if season != self._season:
+                self.new_season(season)
+            if score1 != score1 or score2 != score2:  # NaN, match not played yet
+                continue
+            l1[k], l2[k] = self.update(team1, team2, score1, score2)
+        return l1, l2
+
+    def lambdas(self, team1, team2):
+        """ Returns the expected scores of upcoming matches.
+
+        Parameters
+        ----------
+        team1 : str or list of str
+            Home team(s). Unknown teams have average ratings.
+        team2 : str or list of str
+            Away team(s)
+
+        Returns
+        -------
+        nd.array, nd.array
+            Expectation values l1 and l2 (see MatchPredictor)
+        """
+        attack = np.append(self._attack, 0.0)  # last element: unknown team
+        defense = np.append(self._defense, 0.0)
+        home = np.array([self._team_index.get(team, -1) for team in np.atleast_1d(team1)], dtype=int)
+        away = np.array([self._team_index.get(team, -1) for team in np.atleast_1d(team2)], dtype=int)
+        l1 = np.exp(self.intercept + self.home_advantage + attack[home] + defense[away])
+        l2 = np.exp(self.intercept + attack[away] + defense[home])
+        return l1, l2
+
+    def match_predictor(self, team1, team2):
+        """ Returns a MatchPredictor for an upcoming match """
+        l1, l2 = self.lambdas(team1, team2)
+        return predictor.MatchPredictor(l1[0], l2[0])
+
+    def save(self, filename):
+        """ Saves the state (checkpoint) to a .npz file """
+        np.savez(filename, teams=np.array(self.teams, dtype=str), attack=self.attack, defense=self.defense,
+                 params=np.array([self.learning_rate, self.global_learning_rate, self.season_regression,
+                                  self.intercept, self.home_advantage]),
+                 season=np.array([np.nan if self._season is None else self._season]))
+
+    @classmethod
+    def load(cls, filename):
+        """ Restores ratings from a checkpoint written by save """
+        with np.load(filename) as checkpoint:
+            learning_rate, global_learning_rate, season_regression, intercept, home_advantage = checkpoint['params']
+            ratings = cls(learning_rate, global_learning_rate, season_regression)
+            ratings.intercept = float(intercept)
+            ratings.home_advantage = float(home_advantage)
+            ratings._team_index = {str(team): k for k, team in enumerate(checkpoint['teams'])}
+            ratings._attack = checkpoint['attack'].tolist()
+            ratings._defense = checkpoint['defense'].tolist()
+            season = checkpoint['season'][0]
+            ratings._season = None if np.isnan(season) else int(season)
+        return ratings
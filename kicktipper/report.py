@@ -0,0 +1,167 @@
+import numpy as np
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Rectangle
+
+from . import predictor as predictor_module
+
+# Figures and artists of the current (worker) process, reused for all matches, see _match_figure
+_figures = {}
+
+
+def _match_figure(n_bins):
+    """ Returns the figure of a match and its artists. The figure is created once per process and number of bins and
+    only updated for each match, so no figure, axes or text artists are created per match.
+    """
+    if n_bins not in _figures:
+        fig = Figure(figsize=(9, 4))
+        FigureCanvasAgg(fig)  # Agg canvas: rendering does not need a display
+        ax_probs, ax_tendency = fig.subplots(1, 2, gridspec_kw={'width_ratios': [3, 2]})
+
+        image = ax_probs.imshow(np.zeros((n_bins, n_bins)), cmap='jet', vmin=0, vmax=1)
+        ax_probs.set_ylabel('Goals Team 1')
+        ax_probs.set_xlabel('Goals Team 2')
+        ax_probs.set_title('Score probabilites (%)')
+        texts = [[ax_probs.text(i, j, '', ha='center', va='center', fontsize=7) for i in range(n_bins)]
+                 for j in range(n_bins)]
+        tip = ax_probs.add_patch(Rectangle((-0.5, -0.5), 1, 1, fill=False, edgecolor='white', linewidth=2.5))
+
+        bars = ax_tendency.bar(['Team 1', 'Draw', 'Team 2'], [0, 0, 0], color=['red', 'gray', 'blue'])
+        bar_labels = [ax_tendency.text(k, 0, '', ha='center', va='bottom') for k in range(3)]
+        ax_tendency.set_ylim(0, 1)
+        ax_tendency.set_title('Tendency')
+        title = fig.suptitle('')
+        fig.tight_layout()
+
+        _figures[n_bins] = {'fig': fig, 'image': image, 'texts': texts, 'tip': tip, 'bars': bars,
+                            'bar_labels': bar_labels, 'title': title}
+    return _figures[n_bins]
+
+
+def _render_matches(filenames, titles, score_probs, probs_tendency, tips, dpi=80):
+    """ Renders the figures of several matches to PNG files.
+
+    Module level function, so it can be sent to the worker processes of MatchdayReport.render.
+    """
+    n_bins = score_probs.shape[-1]
+    artists = _match_figure(n_bins)
+    for filename, title, probs, tendency, tip in zip(filenames, titles, score_probs, probs_tendency, tips):
+        artists['title'].set_text(title)
+        artists['image'].set_data(probs)
+        artists['image'].set_clim(0, np.max(probs))
+        for (j, i), prob in np.ndenumerate(probs):
+            artists['texts'][j][i].set_text(round(prob*100, 1))
+        artists['tip'].set_xy((tip[1] - 0.5, tip[0] - 0.5))
+
+        # order of the bars: team 1, draw, team 2 (probs_tendency: team 1, team 2, draw)
+        for bar, label, prob in zip(artists['bars'], artists['bar_labels'], tendency[[0, 2, 1]]):
+            bar.set_height(prob)
+            label.set_y(prob)
+            label.set_text('{:.0%}'.format(prob))
+
+        artists['fig'].savefig(filename, dpi=dpi)
+    return filenames
+
+
+class MatchdayReport:
+    """ Renders reports of a matchday without a display (Agg backend): for each match the score probabilities as heat
+    map, the tendency probabilities and the tipp, collected in an HTML page.
+
+    The score probabilities are computed with the settings (Dixon-Coles rho, dispersions, number of bins) of the
+    predictor which made the tipps, so the heat map shows the distribution the tipp was chosen from.
+
+    The PNG files of large reports are rendered in parallel worker processes. Each worker creates its figure only once
+    and updates the artists for every match. Reports with fewer than MIN_PARALLEL_MATCHES matches (e.g. a matchday)
+    are rendered in the current process, as starting the workers takes longer than rendering.
+
+    Attributes
+    ----------
+    path : str
+        Output directory
+    predictor : predictor.MatchPredictor
+        Predictor which made the tipps, see TipperBundesliga.store_report_for_matchday
+    n_bins : int
+        Number of bins of the score probabilities. If None (default), the number of bins of the predictor is used.
+    n_workers : int
+        Number of worker processes. If None (default), the number of processors is used. If 1, the figures are
+        rendered in the current process.
+    dpi : int
+        Resolution of the PNG files
+    """
+
+    MIN_PARALLEL_MATCHES = 50
+
+    def __init__(self, path='../data/reports', n_bins=None, n_workers=None, dpi=80, predictor=None):
+        self.path = path
+        self.predictor = predictor if predictor is not None else predictor_module.MatchPredictor()
+        self.n_bins = n_bins if n_bins is not None else self.predictor._poisson_n_bins
+        self.n_workers = n_workers
+        self.dpi = dpi
+
+    def render(self, df, name='matchday', score_probs=None):
+        """ Renders the report of a matchday.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Matches with the columns 'team1', 'team2', 'proj_score1', 'proj_score2', 'pred_score1', 'pred_score2', see
+            TipperBundesliga.predicted_scores_for_matchday
+        name : str
+            Name of the report, used for the file names (e.g. 'group_matchday05')
+        score_probs : nd.array, optional
+            Score probabilities of the matches with shape (number of matches, n_bins, n_bins), e.g. from the predictor
+            which made the tipps. If None (default), they are computed with self.predictor.
+
+        Returns
+        -------
+        str
+            Filename of the HTML page
+        """
+        if not os.path.isdir(self.path):  # create directory if it does not exist
+            os.makedirs(self.path)
+
+        if score_probs is None:
+            l1 = df['proj_score1'].values.astype(float)
+            l2 = df['proj_score2'].values.astype(float)
+            score_probs = self.predictor.calculate_score_probs_batch(l1, l2, self.n_bins)
+        probs_tendency = self.predictor.probs_tendency_batch(score_probs)
+        tips = df[['pred_score1', 'pred_score2']].values.astype(int)
+        titles = ['{} - {}: {}:{}'.format(team1, team2, tip[0], tip[1])
+                  for team1, team2, tip in zip(df['team1'], df['team2'], tips)]
+        images = ['{}_{:02d}.png'.format(name, k) for k in range(len(df))]
+        filenames = [os.path.join(self.path, image) for image in images]
+
+        n_workers = self.n_workers if self.n_workers is not None else os.cpu_count()
+        if len(df) < self.MIN_PARALLEL_MATCHES:
+            n_workers = 1
+        chunks = np.array_split(np.arange(len(df)), max(min(n_workers, len(df)), 1))
+        args = [([filenames[k] for k in chunk], [titles[k] for k in chunk], score_probs[chunk], probs_tendency[chunk],
+                 tips[chunk]) for chunk in chunks]
+        if n_workers == 1:
+            for arg in args:
+                _render_matches(*arg, dpi=self.dpi)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(_render_matches, *zip(*args), [self.dpi]*len(args)))
+
+        filename = os.path.join(self.path, name + '.html')
+        with open(filename, 'w') as f:
+            f.write(self._html(name, df, probs_tendency, tips, images))
+        return filename
+
+    @staticmethod
+    def _html(name, df, probs_tendency, tips, images):
+        rows = []
+        for k, (team1, team2) in enumerate(zip(df['team1'], df['team2'])):
+            rows.append('<tr><td>{} - {}</td><td>{:.2f} : {:.2f}</td><td>{}:{}</td><td>{:.0%} / {:.0%} / {:.0%}</td>'
+                        '<td><img src="{}"></td></tr>'.format(
+                            html.escape(str(team1)), html.escape(str(team2)), df['proj_score1'].iloc[k],
+                            df['proj_score2'].iloc[k], tips[k][0], tips[k][1], probs_tendency[k][0],
+                            probs_tendency[k][2], probs_tendency[k][1], html.escape(images[k])))
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{0}</title></head><body>\n'
+                '<h1>{0}</h1>\n<table>\n<tr><th>Match</th><th>Projected score</th><th>Tipp</th>'
+                '<th>Team 1 / Draw / Team 2</th><th></th></tr>\n{1}\n</table>\n</body></html>\n').format(
+                    html.escape(name), '\n'.join(rows))
@@ -0,0 +1,234 @@
+import pandas as pd
+import sqlite3
+import os
+from datetime import datetime
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fixtures (
+    fixture_id INTEGER PRIMARY KEY,
+    season INTEGER NOT NULL,
+    matchday INTEGER,
+    date TEXT,
+    team1 TEXT NOT NULL,
+    team2 TEXT NOT NULL,
+    UNIQUE (season, team1, team2)
+);
+CREATE INDEX IF NOT EXISTS idx_fixtures_matchday ON fixtures (season, matchday);
+
+CREATE TABLE IF NOT EXISTS projections (
+    fixture_id INTEGER NOT NULL REFERENCES fixtures (fixture_id),
+    source TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    proj_score1 REAL,
+    proj_score2 REAL
+);
+CREATE INDEX IF NOT EXISTS idx_projections_fixture ON projections (fixture_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS predictions (
+    fixture_id INTEGER NOT NULL REFERENCES fixtures (fixture_id),
+    timestamp TEXT NOT NULL,
+    pred_score1 INTEGER,
+    pred_score2 INTEGER,
+    prob1 REAL,
+    prob2 REAL,
+    prob_draw REAL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_fixture ON predictions (fixture_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS tips (
+    kicktipp_group TEXT NOT NULL,
+    fixture_id INTEGER NOT NULL REFERENCES fixtures (fixture_id),
+    timestamp TEXT NOT NULL,
+    tipp1 INTEGER,
+    tipp2 INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_tips_fixture ON tips (kicktipp_group, fixture_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS member_tips (
+    kicktipp_group TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    member_name TEXT,
+    fixture_id INTEGER NOT NULL REFERENCES fixtures (fixture_id),
+    tipp1 INTEGER,
+    tipp2 INTEGER,
+    PRIMARY KEY (kicktipp_group, member_id, fixture_id)
+);
+CREATE INDEX IF NOT EXISTS idx_member_tips_fixture ON member_tips (fixture_id);
+
+CREATE TABLE IF NOT EXISTS results (
+    fixture_id INTEGER PRIMARY KEY REFERENCES fixtures (fixture_id),
+    score1 INTEGER,
+    score2 INTEGER
+);
+'''
+
+
+class Store:
+    """ SQLite database for fixtures, projected scores, predictions, submitted tipps, tipps of the group members and
+    results.
+
+    The database is opened once in WAL mode and the connection is kept open, so readers (e.g. an analysis in another
+    process) do not block the writers. Every write is a single transaction with bulk inserts.
+
+    Fixtures are identified by season, team1 and team2. All write methods take DataFrames with the columns 'team1'
+    and 'team2' and register unknown fixtures on the fly.
+    """
+
+    def __init__(self, filename='../data/kicktipper.sqlite'):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            Path to the database file. The file (and its directory) is created if it does not exist.
+        """
+        self.filename = filename
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):  # create directory if it does not exist
+            os.makedirs(directory)
+
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('PRAGMA foreign_keys=ON')
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _timestamp(timestamp=None):
+        if timestamp is None:
+            timestamp = datetime.now()
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        return timestamp
+
+    def _fixture_ids(self, season, df):
+        """ Returns the fixture IDs of the matches in df (columns 'team1', 'team2'). Unknown fixtures are added. """
+        with self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO fixtures (season, team1, team2) VALUES (?,?,?)',
+                                         ((season, t1, t2) for t1, t2 in zip(df['team1'], df['team2'])))
+        rows = self._connection.execute('SELECT team1, team2, fixture_id FROM fixtures WHERE season = ?', (season,))
+        ids = {(t1, t2): fixture_id for t1, t2, fixture_id in rows}
+        return [ids[(t1, t2)] for t1, t2 in zip(df['team1'], df['team2'])]
+
+    def add_fixtures(self, df, season):
+        """ Adds fixtures or updates their matchday and date.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Columns 'team1', 'team2' and optionally 'matchday' and 'date' (e.g. from KicktippAPI.read_games)
+        season : int
+            Season (year in which the season started)
+
+        Returns
+        -------
+        list
+            Fixture IDs
+        """
+        matchday = df['matchday'] if 'matchday' in df else [None]*len(df)
+        date = df['date'] if 'date' in df else [None]*len(df)
+        rows = [(season, _int_or_none(md), d, t1, t2) for md, d, t1, t2 in zip(matchday, date, df['team1'], df['team2'])]
+        with self._connection:
+            self._connection.executemany('''INSERT INTO fixtures (season, matchday, date, team1, team2)
+                                         VALUES (?,?,?,?,?)
+                                         ON CONFLICT (season, team1, team2) DO UPDATE SET
+                                         matchday = COALESCE(excluded.matchday, matchday),
+                                         date = COALESCE(excluded.date, date)''', rows)
+        return self._fixture_ids(season, df)
+
+    def add_projections(self, df, season, source='fivethirtyeight', timestamp=None):
+        """ Adds projected scores (columns 'proj_score1', 'proj_score2')
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        season : int
+        source : str
+            Name of the source of the projections
+        timestamp : str or datetime.datetime
+            Time of the projection. If None (default), the current time is used.
+        """
+        ids = self._fixture_ids(season, df)
+        timestamp = self._timestamp(timestamp)
+        rows = zip(ids, [source]*len(ids), [timestamp]*len(ids), _floats(df['proj_score1']), _floats(df['proj_score2']))
+        with self._connection:
+            self._connection.executemany('INSERT INTO projections VALUES (?,?,?,?,?)', rows)
+
+    def add_predictions(self, df, season, timestamp=None):
+        """ Adds predicted scores (columns 'pred_score1', 'pred_score2', 'prob1', 'prob2', 'prob_draw', see
+        TipperBundesliga.predicted_scores_for_matchday)
+        """
+        ids = self._fixture_ids(season, df)
+        timestamp = self._timestamp(timestamp)
+        rows = zip(ids, [timestamp]*len(ids), _ints(df['pred_score1']), _ints(df['pred_score2']),
+                   _floats(df['prob1']), _floats(df['prob2']), _floats(df['prob_draw']))
+        with self._connection:
+            self._connection.executemany('INSERT INTO predictions VALUES (?,?,?,?,?,?,?)', rows)
+
+    def add_tips(self, kicktipp_group, df, season, timestamp=None):
+        """ Adds tipps submitted to a kicktipp group (columns 'tipp1', 'tipp2') """
+        ids = self._fixture_ids(season, df)
+        timestamp = self._timestamp(timestamp)
+        rows = zip([kicktipp_group]*len(ids), ids, [timestamp]*len(ids), _ints(df['tipp1']), _ints(df['tipp2']))
+        with self._connection:
+            self._connection.executemany('INSERT INTO tips VALUES (?,?,?,?,?)', rows)
+
+    def add_member_tips(self, kicktipp_group, df, season):
+        """ Adds or replaces the tipps of group members (columns 'member_id', 'member_name', 'tipp1', 'tipp2') """
+        ids = self._fixture_ids(season, df)
+        member_name = df['member_name'] if 'member_name' in df else [None]*len(df)
+        rows = zip([kicktipp_group]*len(ids), _ints(df['member_id']), member_name, ids, _ints(df['tipp1']),
+                   _ints(df['tipp2']))
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO member_tips VALUES (?,?,?,?,?,?)', rows)
+
+    def add_results(self, df, season):
+        """ Adds or replaces final scores (columns 'score1', 'score2') """
+        ids = self._fixture_ids(season, df)
+        rows = zip(ids, _ints(df['score1']), _ints(df['score2']))
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO results VALUES (?,?,?)', rows)
+
+    def query(self, sql, params=()):
+        """ Runs a query and returns the result as pandas.DataFrame """
+        return pd.read_sql_query(sql, self._connection, params=params)
+
+    def tips_vs_results(self, kicktipp_group, season):
+        """ Returns the latest submitted tipp and the result of each fixture of a season.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns: matchday, date, team1, team2, tipp1, tipp2, score1, score2
+        """
+        return self.query('''SELECT f.matchday, f.date, f.team1, f.team2, t.tipp1, t.tipp2, r.score1, r.score2
+                          FROM fixtures f
+                          JOIN tips t ON t.fixture_id = f.fixture_id AND t.kicktipp_group = ?
+                              AND t.timestamp = (SELECT MAX(timestamp) FROM tips
+                                                 WHERE kicktipp_group = t.kicktipp_group AND fixture_id = f.fixture_id)
+                          LEFT JOIN results r ON r.fixture_id = f.fixture_id
+                          WHERE f.season = ?
+                          ORDER BY f.matchday, f.fixture_id''', (kicktipp_group, season))
+
+
+def _int_or_none(value):
+    return None if pd.isna(value) else int(value)
+
+
+def _ints(values):
+    """ Converts values to int (None for missing values), as sqlite3 does not accept numpy integers """
+    return [_int_or_none(v) for v in values]
+
+
+def _floats(values):
+    return [None if pd.isna(v) else float(v) for v in values]
@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+import itertools
+import functools
+import sqlite3
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from . import backtest
+from . import predictor
+
+# Parameters of a configuration. All other keys of a configuration are ignored.
+SWEEP_PARAMETERS = ('strategy', 'n_bins', 'lambda_scale', 'draw_bias', 'tie_break')
+SWEEP_DEFAULTS = {'strategy': 'predicted_score', 'n_bins': 8, 'lambda_scale': 1.0, 'draw_bias': 0.0,
+                  'tie_break': 'team1'}
+
+# Historical data shared (read-only) by the worker processes, see _init_worker
+_shared = {}
+
+
+def _init_worker(data_dir):
+    """ Memory-maps the historical data in a worker process """
+    for column in ('proj_score1', 'proj_score2', 'results', 'season'):
+        _shared[column] = np.load(os.path.join(data_dir, column + '.npy'), mmap_mode='r')
+
+
+@functools.lru_cache(maxsize=4)
+def _score_probs(n_bins, lambda_scale):
+    """ Score probabilities of all matches. They only depend on n_bins and lambda_scale, so they are cached and shared
+    by all configurations evaluated in a worker process.
+    """
+    pred = predictor.MatchPredictor()
+    return pred.calculate_score_probs_batch(lambda_scale*np.asarray(_shared['proj_score1']),
+                                            lambda_scale*np.asarray(_shared['proj_score2']), n_bins)
+
+
+def _evaluate_configs(configs, points):
+    """ Evaluates configurations which share n_bins and lambda_scale. Runs in a worker process.
+
+    Returns
+    -------
+    list of dict
+        One row for each configuration and season
+    """
+    results = np.asarray(_shared['results'])
+    season = np.asarray(_shared['season'])
+    seasons, season_idx = np.unique(season, return_inverse=True)
+    n_matches = np.bincount(season_idx, minlength=len(seasons))
+
+    rows = []
+    for config in configs:
+        score_probs = _score_probs(config['n_bins'], config['lambda_scale'])
+        score_probs = backtest.apply_draw_bias(score_probs, config['draw_bias'])
+        evaluation = backtest.evaluate_tips(score_probs, results, config['strategy'], points, config['tie_break'])
+
+        points_season = np.bincount(season_idx, weights=evaluation['points'], minlength=len(seasons))
+        metrics = {metric: np.bincount(season_idx, weights=evaluation[metric], minlength=len(seasons)) / n_matches
+                   for metric in ('brier', 'rps', 'log_loss')}
+        for k, s in enumerate(seasons):
+            row = dict(config)
+            row.update({'season': int(s), 'matches': int(n_matches[k]), 'points': int(points_season[k]),
+                        'points_per_match': points_season[k] / n_matches[k]})
+            row.update({metric: values[k] for metric, values in metrics.items()})
+            rows.append(row)
+
+    return rows
+
+
+class Sweep:
+    """ Evaluates many parameter configurations of the tipp generation on historical data.
+
+    A configuration is a dict with the keys from SWEEP_PARAMETERS:
+
+    * strategy: name of a strategy from backtest.STRATEGIES
+    * n_bins: number of bins of the Poisson distributions (see MatchPredictor._poisson_n_bins)
+    * lambda_scale: factor applied to the projected scores
+    * draw_bias: relative change of the draw probabilities (see backtest.apply_draw_bias)
+    * tie_break: tendency tipped if team 1 wins and team 2 wins are tied, one of predictor.TIE_BREAKS (see
+      MatchPredictor.tie_break; only used by the strategy 'predicted_score')
+
+    Missing keys are taken from SWEEP_DEFAULTS. The configurations are evaluated in parallel worker processes, which
+    share the historical data as read-only memory-mapped files. Configurations with the same n_bins and lambda_scale
+    are evaluated in the same task, so their score probabilities are computed only once.
+
+    Results (one row per configuration and season) are appended to the table "sweep_results" of a SQLite database.
+
+    Attributes
+    ----------
+    data : pandas.DataFrame
+        Historical matches (FiveThirtyEight format), see backtest.Backtest
+    points : tuple
+        Points for (correct score, correct goal difference, correct tendency)
+    """
+
+    def __init__(self, data=None, leagues=None, seasons=None, points=(4, 3, 2), cache_dir='../data/sweep'):
+        """
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Historical matches. If None (default), all leagues and seasons are read from the FiveThirtyEight data file.
+        leagues : list
+            League IDs or names to include, see backtest.Backtest.select
+        seasons : list
+            Seasons to include, see backtest.Backtest.select
+        points : tuple
+            See kicktipp_points
+        cache_dir : str
+            Directory for the memory-mapped data and the results database
+        """
+        self.data = backtest.Backtest(data).select(leagues, seasons)
+        self.points = points
+
+        self._cache_dir = cache_dir
+        self._data_dir = os.path.join(cache_dir, 'data')
+        self._db_filename = os.path.join(cache_dir, 'sweep.sqlite')
+
+    @staticmethod
+    def grid(param_grid):
+        """ Returns all combinations of the parameter values.
+
+        Parameters
+        ----------
+        param_grid : dict
+            Parameter names and lists of values, e.g. {'n_bins': [6, 8, 10], 'draw_bias': [0, 0.1]}
+
+        Returns
+        -------
+        list of dict
+            Configurations
+        """
+        names = list(param_grid)
+        return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+    @staticmethod
+    def random(space, n_iter, seed=None):
+        """ Returns randomly drawn configurations.
+
+        Parameters
+        ----------
+        space : dict
+            Parameter names and their distributions. A list is sampled uniformly, a tuple (low, high) is sampled from
+            a continuous uniform distribution and a callable is called with a numpy.random.Generator.
+        n_iter : int
+            Number of configurations
+        seed : int
+            Seed of the random number generator
+
+        Returns
+        -------
+        list of dict
+            Configurations
+        """
+        rng = np.random.default_rng(seed)
+
+        def draw(dist):
+            if callable(dist):
+                return dist(rng)
+            elif isinstance(dist, tuple):
+                return float(rng.uniform(*dist))
+            else:
+                return dist[rng.integers(len(dist))]
+
+        return [{name: draw(dist) for name, dist in space.items()} for _ in range(n_iter)]
+
+    def _write_shared_data(self):
+        """ Writes the historical data to .npy files, which are memory-mapped by the worker processes """
+        if not os.path.isdir(self._data_dir):  # create directory if it does not exist
+            os.makedirs(self._data_dir)
+
+        arrays = {'proj_score1': self.data['proj_score1'].values.astype(float),
+                  'proj_score2': self.data['proj_score2'].values.astype(float),
+                  'results': self.data[['score1', 'score2']].values.astype(int),
+                  'season': self.data['season'].values.astype(int)}
+        for column, values in arrays.items():
+            np.save(os.path.join(self._data_dir, column + '.npy'), values)
+
+    def run(self, configs, n_workers=None):
+        """ Evaluates the configurations and stores the results in the database.
+
+        Parameters
+        ----------
+        configs : list of dict
+            Configurations, e.g. from grid or random
+        n_workers : int
+            Number of worker processes. If None (default), the number of processors is used.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Results of this run, one row per configuration and season
+        """
+        self._write_shared_data()
+
+        configs = [{name: config.get(name, SWEEP_DEFAULTS[name]) for name in SWEEP_PARAMETERS} for config in configs]
+        # group the configurations sharing the cached score probabilities
+        tasks = {}
+        for config in configs:
+            tasks.setdefault((config['n_bins'], config['lambda_scale']), []).append(config)
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(self._data_dir,)) as executor:
+            rows = list(itertools.chain.from_iterable(
+                executor.map(_evaluate_configs, tasks.values(), itertools.repeat(self.points))))
+
+        df = pd.DataFrame(rows)
+        df.insert(0, 'run', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._store_results(df)
+        return df
+
+    def _store_results(self, df):
+        sql_connection = sqlite3.connect(self._db_filename)
+        with sql_connection:
+            sql_connection.execute('''CREATE TABLE IF NOT EXISTS sweep_results (run TEXT, strategy TEXT,
+                                   n_bins INTEGER, lambda_scale REAL, draw_bias REAL, season INTEGER, matches INTEGER,
+                                   points INTEGER, points_per_match REAL, brier REAL, rps REAL, log_loss REAL,
+                                   tie_break TEXT)''')
+            columns = [row[1] for row in sql_connection.execute('PRAGMA table_info(sweep_results)')]
+            if 'tie_break' not in columns:  # database of an older version
+                sql_connection.execute('ALTER TABLE sweep_results ADD COLUMN tie_break TEXT')
+            sql_connection.execute('''CREATE INDEX IF NOT EXISTS idx_sweep_results_season
+                                   ON sweep_results (season, points_per_match)''')
+            sql_connection.executemany('INSERT INTO sweep_results ({}) VALUES ({})'.format(
+                ', '.join(df.columns), ', '.join('?'*len(df.columns))), df.itertuples(index=False, name=None))
+        sql_connection.close()
+
+    def query(self, sql='SELECT * FROM sweep_results', params=()):
+        """ Queries the results database.
+
+        Example: the best configurations of the 2019/20 season
+        sweep.query('SELECT * FROM sweep_results WHERE season = ? ORDER BY points_per_match DESC LIMIT 10', (2019,))
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        sql_connection = sqlite3.connect(self._db_filename)
+        df = pd.read_sql_query(sql, sql_connection, params=params)
+        sql_connection.close()
+        return df
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 import pandas as pd
+from scipy import stats
 
 import sqlite3
 
@@ -10,111 +11,272 @@ from . import tools
 class Team:
     """ Representation of a team
 
+    A Team is a lightweight view onto one row of the arrays of a League. A team created without a league keeps its
+    parameters in a small dict, until it is added to a league (see League.add_team).
+
     Attributes
     ----------
     name : str
         Team's name
-    goals_per_season : int
+    goals_per_season : float
         Total number of goals the team is exptected to score in a complete season.
         This attibute can be used to calculate the team's offense strength
         (see compute_offense_strength_from_scored_goals).
+    scored_goals : float
+        Alias of goals_per_season
     offense_strength : float
         Number indicating the team's offense strength
     defense_strength : float
         Number indicating the team's defense strength
+    index : int
+        Team's index within its league (None for a team without league)
     """
 
-    no_of_teams = 0
+    __slots__ = ('_league', '_row', '_values')
 
-    ''' Constructor'''
-    def __init__(self, name=''):
+    def __init__(self, name='', league=None):
         """
 
         Parameters
         ----------
         name : str
             Team's name
+        league : League, optional
+            League the team is added to
         """
-        self._name = name
-        self._goals_per_season = 0
-        self._offense_strength = 0
-        self._defense_strength = 0
-
-        Team.no_of_teams += 1  # ToDo: obosolete? Ueberhaupt sinnvoll, vernuenftige Datenkapselung?
-
-        self._index = Team.no_of_teams
+        self._league = None
+        self._row = None
+        self._values = {'name': name, 'goals_per_season': 0.0, 'offense_strength': 0.0, 'defense_strength': 0.0}
+        if league is not None:
+            league.add_team(self)
+
+    @classmethod
+    def _view(cls, league, row):
+        """ Creates a Team object for an existing row of a league """
+        team = cls.__new__(cls)
+        team._league = league
+        team._row = row
+        team._values = None
+        return team
 
     @property
     def name(self):
-        return self._name
+        if self._league is None:
+            return self._values['name']
+        return self._league._names[self._row]
 
     @name.setter
     def name(self, new_name):
-        self._name = new_name
+        if self._league is None:
+            self._values['name'] = new_name
+        else:
+            self._league._rename(self._row, new_name)
 
     @property
     def goals_per_season(self):
-        return self._goals_per_season
+        if self._league is None:
+            return float(self._values['goals_per_season'])
+        return float(self._league._goals[self._row])
 
     @goals_per_season.setter
     def goals_per_season(self, value):
-        self._goals_per_season = value
+        if self._league is None:
+            self._values['goals_per_season'] = value
+        else:
+            self._league._goals[self._row] = value
+
+    scored_goals = goals_per_season
 
     @property
     def offense_strength(self):
-        return self._offense_strength
+        if self._league is None:
+            return float(self._values['offense_strength'])
+        return float(self._league._offense[self._row])
 
     @offense_strength.setter
     def offense_strength(self, value):
-        self._offense_strength = value
+        if self._league is None:
+            self._values['offense_strength'] = value
+        else:
+            self._league._offense[self._row] = value
 
     @property
     def defense_strength(self):
-        return self._defense_strength
+        if self._league is None:
+            return float(self._values['defense_strength'])
+        return float(self._league._defense[self._row])
 
     @defense_strength.setter
     def defense_strength(self, value):
-        self._defense_strength = value
+        if self._league is None:
+            self._values['defense_strength'] = value
+        else:
+            self._league._defense[self._row] = value
 
     @property
     def index(self):
-        return self._index
+        if self._league is None:
+            return None
+        return int(self._league._indices[self._row])
+
+    @property
+    def league(self):
+        """League: League the team belongs to (None if it was not added to a league)"""
+        return self._league
 
-    def __del__(self):
-        Team.no_of_teams -= 1
+    @property
+    def row(self):
+        """int: Row of the team in the arrays of its league (None if it was not added to a league)"""
+        return self._row
 
     def compute_offense_strength_from_scored_goals(self, home_team_advantage, mu):
-        self._offense_strength = (self._goals_per_season - 17*home_team_advantage)/(mu*17)
+        self.offense_strength = (self.goals_per_season - 17*home_team_advantage)/(mu*17)
 
 
 class League:
     """ League is a container for Team objects
-    """
 
-    no_of_teams = 0
+    The team parameters are stored in contiguous numpy arrays (one row per team), so they can be used for vectorized
+    calculations. Teams are found by name or index via dictionaries.
+
+    Attributes
+    ----------
+    name : str
+        Name of the league
+    goals_per_season : nd.array
+        Expected goals per season of all teams (by row)
+    offense_strengths : nd.array
+        Offense strengths of all teams (by row)
+    defense_strengths : nd.array
+        Defense strengths of all teams (by row)
+    indices : nd.array
+        Indices of all teams (by row)
+    """
 
     def __init__(self, name):
         """Constructor
 
         """
         self.name = name
-        self.team_dict = {}
 
-    def __del__(self):
-        """Destructor
+        self._capacity = 0
+        self._names = []
+        self._teams = []
+        self._indices = np.zeros(0, dtype=int)
+        self._goals = np.zeros(0)
+        self._offense = np.zeros(0)
+        self._defense = np.zeros(0)
 
-        """
-        del self.team_dict
+        self._name_to_index = {}
+        self._index_to_row = {}
+        self._similar_names = {}  # cache for find_team_object_with_similar_name: name => (index, similarity)
+        self._name_matcher = None  # tools.NameMatcher of the team names, built when needed
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def no_of_teams(self):
+        """int: Number of teams in the league"""
+        return len(self._names)
+
+    @property
+    def team_dict(self):
+        """dict: Pairs team object: team index"""
+        return {team: team.index for team in self._teams}
+
+    @property
+    def teams(self):
+        """list: Team objects (by row)"""
+        return list(self._teams)
 
-    def add_team(self, team):
+    @property
+    def team_names(self):
+        """list: Team names (by row)"""
+        return list(self._names)
+
+    @property
+    def indices(self):
+        return self._indices[:len(self)]
+
+    @property
+    def goals_per_season(self):
+        return self._goals[:len(self)]
+
+    @property
+    def offense_strengths(self):
+        return self._offense[:len(self)]
+
+    @property
+    def defense_strengths(self):
+        return self._defense[:len(self)]
+
+    def _append_row(self, team, name, goals_per_season=0, offense_strength=0, defense_strength=0, index=None):
+        """ Appends a row to the arrays and registers the team object for it. If team is None, a new team object is
+        created.
+
+        Returns
+        -------
+        int
+            The new row
+        """
+        row = len(self._names)
+        if index is None:
+            index = max(self._index_to_row, default=0) + 1  # indices start at 1
+        elif index in self._index_to_row:
+            raise ValueError('Team index {} already exists in {}.'.format(index, self.name))
+
+        if row == self._capacity:  # grow the arrays
+            self._capacity = max(2*self._capacity, 32)
+            self._indices = np.resize(self._indices, self._capacity)
+            self._goals = np.resize(self._goals, self._capacity)
+            self._offense = np.resize(self._offense, self._capacity)
+            self._defense = np.resize(self._defense, self._capacity)
+
+        self._names.append(name)
+        self._teams.append(team if team is not None else Team._view(self, row))
+        self._indices[row] = index
+        self._goals[row] = goals_per_season
+        self._offense[row] = offense_strength
+        self._defense[row] = defense_strength
+
+        self._name_to_index[name] = index
+        self._index_to_row[index] = row
+        self._similar_names.clear()
+        self._name_matcher = None
+
+        return row
+
+    def _rename(self, row, new_name):
+        index = int(self._indices[row])
+        old_name = self._names[row]
+        if self._name_to_index.get(old_name) == index:
+            del self._name_to_index[old_name]
+        self._names[row] = new_name
+        self._name_to_index[new_name] = index
+        self._similar_names.clear()
+        self._name_matcher = None
+
+    def add_team(self, team, index=None):
         """Add Team to Liga.
 
+        The parameters of the team are copied into the arrays of this league and the team object becomes a view onto
+        them. If the team belonged to another league before, that league keeps a copy of the team.
+
         :param team: Team object
+        :param int index: Index of the team. If None (default), the next free index is used.
         """
-
-        # add team object to member variable "team_dict" (that is a dictionary (pairs key:value=team object:team index))
-        self.team_dict.update({team : team.index})
-        self.no_of_teams += 1
+        if team.league is self:
+            return
+
+        old_league, old_row = team.league, team.row
+        row = self._append_row(team, team.name, team.goals_per_season, team.offense_strength, team.defense_strength,
+                               index)
+        if old_league is not None:
+            old_league._teams[old_row] = Team._view(old_league, old_row)
+        team._league = self
+        team._row = row
+        team._values = None
 
     def get_team_object_from_index(self, index):
         """ Returns the team object with the given index.
@@ -122,12 +284,10 @@ class League:
         :param int index: Team index
         :return: Team object. None, if no team with <index> is found.
         """
-
-        for team in self.team_dict:
-            if index == team.index:
-                return team
-
-        return None
+        row = self._index_to_row.get(index)
+        if row is None:
+            return None
+        return self._teams[row]
 
     def get_index_from_team_name(self, team_name):
         """ Returns the index of the passed team name.
@@ -135,12 +295,7 @@ class League:
         :param string team_name: Name of the team
         :return: int index of team. None if team is not found in Liga.
         """
-
-        for team in self.team_dict:
-            if team.name == team_name:
-                return team.index
-
-        return None
+        return self._name_to_index.get(team_name)
 
     def get_team_object_from_team_name(self, team_name, exact_match=True):
         """ Returns team object of the passed team name.
@@ -150,10 +305,9 @@ class League:
          exactly. If False, the object with the closest name to team_name is returned.
         :return: Team object. None if team_name is not found in Liga.
         """
-
-        for team in self.team_dict:
-            if team.name == team_name:
-                return team
+        index = self._name_to_index.get(team_name)
+        if index is not None:
+            return self.get_team_object_from_index(index)
 
         if exact_match:
             return None
@@ -161,35 +315,44 @@ class League:
             teamobject, p = self.find_team_object_with_similar_name(team_name)
             return teamobject
 
-        #if team_name in self.team_dict:
-        #    teamobject = self.team_dict[team_name]
-        #    return teamobject
-        #elif exact_match:
-        #    return None
-        #else:
-        #    teamobject, p = self.find_team_object_with_similar_name(team_name)
-        #    #print(team_name + " / " + teamobject.name + " / " + str(p))
-        #    return teamobject
-
     def find_team_object_with_similar_name(self, team_name):
         """ Returns the team object with the name closest to team_name.
 
-        The method searches through all team objects in the Liga object
+        The names are looked up in an n-gram index (see tools.NameMatcher). Results are cached until the teams change.
 
         :param string team_name: Name of the team to find.
         :return: Team object with exact or similar name
         """
-        p = -1
-        p_max = -1
-        closest_name = None
-        for team in self.team_dict:
-            p = tools.similar(team_name, team.name)
-            if p > p_max:
-                closest_name = team.name
-                p_max = p
-
-        # return self.team_dict[closest_name], p_max
-        return self.get_team_object_from_team_name(closest_name, exact_match=True), p_max
+        if team_name not in self._similar_names:
+            if self._name_matcher is None:
+                self._name_matcher = tools.NameMatcher(self._name_to_index)
+            name, p_max = self._name_matcher.match(team_name)
+            self._similar_names[team_name] = (self._name_to_index.get(name), p_max)
+
+        index, p_max = self._similar_names[team_name]
+        return self.get_team_object_from_index(index), p_max
+
+    def rows_from_team_names(self, team_names, exact_match=True):
+        """ Returns the rows of the teams in the arrays of the league.
+
+        :param list team_names: Names of the teams to find
+        :param bool exact_match: See get_team_object_from_team_name
+        :return: nd.array with the rows
+        """
+        rows = []
+        for team_name in team_names:
+            team = self.get_team_object_from_team_name(team_name, exact_match)
+            if team is None:
+                raise KeyError('Team {} not found in {}.'.format(team_name, self.name))
+            rows.append(team.row)
+        return np.array(rows, dtype=int)
+
+    def compute_offense_strengths(self, home_team_advantage, mu):
+        """ Computes the offense strengths of all teams from their scored goals.
+
+        See Team.compute_offense_strength_from_scored_goals
+        """
+        self.offense_strengths[:] = (self.goals_per_season - 17*home_team_advantage)/(mu*17)
 
     def create_db_table(self, name=None):
         """ Creates a new table in a database for storage of the team parameters.
@@ -211,7 +374,8 @@ class League:
         sql_connection = sqlite3.connect(name + '.sqlite')
         sql_cursor = sql_connection.cursor()
         sql_cursor.execute('''CREATE TABLE IF NOT EXISTS {} (team_index INTEGER PRIMARY KEY, team_name TEXT UNIQUE,
-                            scored_goals INT, offense_strength FLOAT, defense_strength FLOAT)'''.format(name))
+                            scored_goals INT, offense_strength FLOAT, defense_strength FLOAT)'''.format(
+            tools.quote_identifier(name)))
         sql_connection.commit()
         sql_connection.close()
 
@@ -228,15 +392,9 @@ class League:
         sql_connection = sqlite3.connect(name + '.sqlite')
         sql_cursor = sql_connection.cursor()
 
-        for team in self.team_dict:
-            index = team.index
-            tname = team.name
-            goals = team.scored_goals
-            offense = team.offense_strength
-            defense = team.defense_strength
-
-            sql_cursor.execute('INSERT OR REPLACE INTO {} VALUES (?,?,?,?,?)'.format(name),
-                               (index, tname, goals, offense, defense))
+        rows = zip(self.indices.tolist(), self._names, self.goals_per_season.tolist(), self.offense_strengths.tolist(),
+                   self.defense_strengths.tolist())
+        sql_cursor.executemany('INSERT OR REPLACE INTO {} VALUES (?,?,?,?,?)'.format(tools.quote_identifier(name)), rows)
 
         sql_connection.commit()
         sql_connection.close()
@@ -244,7 +402,8 @@ class League:
     def read_db(self, name=None):
         """ Reads the content from the database.
 
-        The content populates the Liga, i.e. team objects are added to the current Liga instance.
+        The content populates the Liga, i.e. team objects are added to the current Liga instance (with the index
+        stored in the database).
 
         :param string name: Name of the database. Filename will be <name>.sqlite.
             Default name is the name of the Liga object.
@@ -257,20 +416,21 @@ class League:
         sql_connection = sqlite3.connect(name + '.sqlite')
         sql_cursor = sql_connection.cursor()
 
-        sql_cursor.execute('SELECT * FROM {}'.format(name))
+        sql_cursor.execute('SELECT * FROM {}'.format(tools.quote_identifier(name)))
         data = sql_cursor.fetchall()
 
         sql_connection.close()
 
-        # add teams to Liga, according to database content.
-        for kk in range(len(data)):
-            team = Team(data[kk][1])
-            #team.index = data[kk][0]
-            team.scored_goals = data[kk][2]
-            team.offense_strength = data[kk][3]
-            team.defense_strength = data[kk][4]
-            self.add_team(team)
-            #print(team)
+        # add teams to Liga, according to database content. Teams with an existing index are updated.
+        for index, team_name, scored_goals, offense_strength, defense_strength in data:
+            row = self._index_to_row.get(index)
+            if row is None:
+                self._append_row(None, team_name, scored_goals, offense_strength, defense_strength, index)
+            else:
+                self._rename(row, team_name)
+                self._goals[row] = scored_goals
+                self._offense[row] = offense_strength
+                self._defense[row] = defense_strength
 
         return data
 
@@ -288,13 +448,23 @@ class ScoreCalculator:
         Home team
     team2 : Team
         Away team
+    rng : numpy.random.Generator
+        Random number generator used for random scores
     """
 
-    def __init__(self):
+    def __init__(self, seed=None):
+        """
+
+        Parameters
+        ----------
+        seed : int, optional
+            Seed of the random number generator
+        """
         self.mu = 2.5
         self.home_team_advantage = 0
         self.team1 = Team()
         self.team2 = Team()
+        self.rng = np.random.default_rng(seed)
 
     def expected_score(self):
         """ Calculates "expected score" for a match from individual team strengths.
@@ -309,18 +479,72 @@ class ScoreCalculator:
         score1 = self.mu/2*self.team1.offense_strength - self.team2.defense_strength + self.home_team_advantage
         score2 = self.mu/2*self.team2.offense_strength - self.team1.defense_strength
 
-        d = score1-score2
+        score1, score2 = self._tips_from_expected_scores(score1, score2)
+        return int(score1), int(score2)
+
+    def expected_score_matrix(self, league):
+        """ Calculates the (unrounded) expected scores for all pairings of the teams of a league.
+
+        Parameters
+        ----------
+        league : League
 
-        score1 = round(score1, 0)
-        score2 = round(score2, 0)
+        Returns
+        -------
+        nd.array
+            Array with shape (number of teams, number of teams, 2). Element [i, j] holds the expected scores of the
+            match of the team in row i (home team) against the team in row j (away team).
+        """
+        offense = self.mu/2*league.offense_strengths
+        defense = league.defense_strengths
+        score1 = offense[:, np.newaxis] - defense[np.newaxis, :] + self.home_team_advantage
+        score2 = offense[np.newaxis, :] - defense[:, np.newaxis]
 
-        if score1 == score2:  # check if the draw ist justified...
-            if d > 0.5:  # team1 is much better
-                score1 += 1
-            if d < -0.5:  # team2 is much better
-                score2 += 1
+        return np.stack([score1, score2], axis=-1)
 
-        return int(score1), int(score2)
+    def expected_tip_matrix(self, league):
+        """ Calculates the expected score (see expected_score) for all pairings of the teams of a league.
+
+        Tipps for a set of matches are obtained by indexing the matrix with the rows of the teams, e.g.
+        expected_tip_matrix(league)[rows_team1, rows_team2] (see League.rows_from_team_names).
+
+        Parameters
+        ----------
+        league : League
+
+        Returns
+        -------
+        nd.array
+            Integer array with shape (number of teams, number of teams, 2), see expected_score_matrix
+        """
+        scores = self.expected_score_matrix(league)
+        return np.stack(self._tips_from_expected_scores(scores[..., 0], scores[..., 1]), axis=-1)
+
+    @staticmethod
+    def _tips_from_expected_scores(score1, score2):
+        """ Rounds expected scores to tipps. A draw is only kept, if the difference of the expected scores is small.
+
+        Parameters
+        ----------
+        score1 : float or nd.array
+        score2 : float or nd.array
+
+        Returns
+        -------
+        nd.array, nd.array
+            Integer tipps for team 1 and team 2
+        """
+        d = np.asarray(score1 - score2)
+
+        tip1 = np.round(score1).astype(int)
+        tip2 = np.round(score2).astype(int)
+
+        # check if the draw ist justified...
+        draw = tip1 == tip2
+        tip1 = tip1 + (draw & (d > 0.5))  # team1 is much better
+        tip2 = tip2 + (draw & (d < -0.5))  # team2 is much better
+
+        return tip1, tip2
 
     def random_score(self, draw_allowed=True):
         """ Generates random score, where the individual team score is drawn from a Poissonian distribution.
@@ -335,19 +559,65 @@ class ScoreCalculator:
         int, int
             Expected score of team1 and team2
         """
+        score1, score2 = self.random_scores(1, draw_allowed=draw_allowed)[0]
+        return int(score1), int(score2)
 
-        result_ok = False
-        score1, score2 = 0, 0
-        while not result_ok:
-            score1 = np.random.poisson(self.mu/2)
-            score2 = np.random.poisson(self.mu/2)
-            if draw_allowed:
-                result_ok = True
-            else:
-                if score1 != score2:
-                    result_ok = True
+    def random_scores(self, n=None, l1=None, l2=None, draw_allowed=True, seed=None):
+        """ Generates random scores for many matches at once. The individual team scores are drawn from Poissonian
+        distributions.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of scores. Not required if l1 or l2 are arrays.
+        l1 : float or array_like, optional
+            Expectation value(s) for the score of team 1, one element per match. Default: mu/2
+        l2 : float or array_like, optional
+            Expectation value(s) for the score of team 2, one element per match. Default: mu/2
+        draw_allowed : bool, optional
+            Indicates if a draw is a legal result. Default: True
+            If False, the scores are sampled from the joint distribution conditioned on the result not being a draw.
+        seed : int or numpy.random.Generator, optional
+            Seed or generator for reproducible scores. If None (default), the generator of the ScoreCalculator is used.
+
+        Returns
+        -------
+        nd.array
+            Scores with shape (number of matches, 2)
+        """
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        if l1 is None:
+            l1 = self.mu/2
+        if l2 is None:
+            l2 = self.mu/2
+        shape = np.broadcast_shapes(np.shape(l1), np.shape(l2), () if n is None else (n,))
+        l1 = np.broadcast_to(np.asarray(l1, dtype=float), shape).ravel()
+        l2 = np.broadcast_to(np.asarray(l2, dtype=float), shape).ravel()
+
+        if draw_allowed:
+            return np.stack([rng.poisson(l1), rng.poisson(l2)], axis=1)
+
+        # Exact sampling conditioned on the result not being a draw:
+        # 1) score1 from its conditional marginal distribution p(score1=k) * (1 - p(score2=k))
+        # 2) score2 from its distribution with the value score1 excluded
+        # The goals are limited to a range holding all but 1e-15 of the probability mass.
+        n_goals = int(stats.poisson.isf(1e-15, max(np.max(l1, initial=0), np.max(l2, initial=0)))) + 2
+        goals = np.arange(n_goals)
+        pmf1 = stats.poisson.pmf(goals, l1[:, np.newaxis])
+        pmf2 = stats.poisson.pmf(goals, l2[:, np.newaxis])
+
+        score1 = self._inverse_transform_sample(pmf1 * (1 - pmf2), rng)
+        pmf2[np.arange(len(l2)), score1] = 0
+        score2 = self._inverse_transform_sample(pmf2, rng)
+
+        return np.stack([score1, score2], axis=1)
 
-        return score1, score2
+    @staticmethod
+    def _inverse_transform_sample(weights, rng):
+        """ Draws one index per row of weights, with probabilities proportional to the (unnormalized) weights """
+        cdf = np.cumsum(weights, axis=1)
+        u = rng.random(len(weights)) * cdf[:, -1]
+        return np.minimum(np.sum(cdf <= u[:, np.newaxis], axis=1), weights.shape[1] - 1)
 
     @staticmethod
     def probability_from_odd(rawodd, overround):
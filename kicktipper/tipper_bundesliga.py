@@ -1,65 +1,161 @@
+import numpy as np
 import pandas as pd
 from typing import Union
 from datetime import datetime
 import os
+import warnings
 
 from . import kicktipp_api
 from . import fivethirtyeight
+from . import odds
 from . import predictor
+from . import report as reporting
 from . import tools
+from . import instrumentation as instr
 
 
 class TipperBundesliga:
-    def __init__(self, kicktipp_group):
+    def __init__(self, kicktipp_group, store=None, archive=None, prediction_table=None):
         self._datapath = '../data'
 
         self.kicktipp_group = kicktipp_group
         self.kicktipp_username = None
         self.kicktipp_password = None
+        # login cookies are saved here and reused by the next login (None: always log in with username and password)
+        self.kicktipp_session_file = os.path.join(self._datapath, 'session_' + kicktipp_group + '.json')
+        # year in which the current season started: the latest season of the first projected_scores_read. Set it to
+        # None to switch to the next season.
+        self.season = None
+        self.store = store  # optional store.Store for fixtures, projections, predictions and tipps
+        self.archive = archive  # optional archive.SnapshotArchive for matchday snapshots
 
-        self._kicktipp_api = kicktipp_api.KicktippAPI(self.kicktipp_group)
-        self._fte = fivethirtyeight.FiveThirtyEight()
-        self._pred = predictor.MatchPredictor()
+        self.instrumentation = instr.Instrumentation()
+        self._kicktipp_api = kicktipp_api.KicktippAPI(self.kicktipp_group, self.instrumentation)
+        self._fte = fivethirtyeight.FiveThirtyEight(self.instrumentation)
+        self._pred = predictor.MatchPredictor(table=prediction_table)  # optional lookup.PredictionTable
+        self._aligned_names = {}  # team name => name in the league table
+        self._predictions = {}  # (team1, team2) => (l1, l2, predicted score and tendency probabilities)
+        self._stored_projections = {}  # (team1, team2) => (l1, l2) last written to self.store
+        self._stored_predictions = {}  # (team1, team2) => (l1, l2) of the prediction last written to self.store
+        self._stored_results = {}  # (team1, team2) => (score1, score2) last written to self.store
 
+        self.projected_scores_changed = None
         self.leaguetable = self.leaguetable_read()
+        self.team_dtype = self.leaguetable['team'].dtype  # team-code dictionary shared with the projected scores
+        self._team_matcher = tools.NameMatcher(self.leaguetable['team'])
         self.projected_scores = self.projected_scores_read()
 
     def find_similar_teamname(self, teamname):
-        p = [tools.similar(teamname, team) for team in self.leaguetable['team']]
-        idx = p.index(max(p))
-        return self.leaguetable.iloc[idx]['team']
+        name, _ = self._team_matcher.match(teamname)
+        return name
 
+    @instr.instrumented('tipper.align_team_names')
     def align_team_names_in_df(self, df):
         dfc = df.copy()
-        for i, row in dfc.iterrows():
-            name = self.find_similar_teamname(row['team1'])
-            dfc.at[i, 'team1'] = name
-            name = self.find_similar_teamname(row['team2'])
-            dfc.at[i, 'team2'] = name
+        # each distinct name is matched only once, also across calls
+        for name in set(dfc['team1']).union(dfc['team2']) - set(self._aligned_names):
+            self._aligned_names[name] = self.find_similar_teamname(name)
+        for column in ('team1', 'team2'):
+            dfc[column] = dfc[column].map(self._aligned_names)
+            if isinstance(df[column].dtype, pd.CategoricalDtype):  # aligned names are coded like the league table
+                dfc[column] = dfc[column].astype(self.team_dtype)
         return dfc
 
     def leaguetable_read(self, filename='Bundesliga.csv'):
         filename = os.path.join(self._datapath, filename)
-        return pd.read_csv(filename)
+        leaguetable = pd.read_csv(filename)
+        leaguetable['team'] = leaguetable['team'].astype(fivethirtyeight.team_dtype(leaguetable['team']))
+        return leaguetable
 
     def login(self):
-        self._kicktipp_api.login(self.kicktipp_username, self.kicktipp_password)
+        self._kicktipp_api.session_file = self.kicktipp_session_file
+        return self._kicktipp_api.login(self.kicktipp_username, self.kicktipp_password)
 
     def logout(self):
         self._kicktipp_api.logout()
 
+    @instr.instrumented('tipper.projected_scores_read')
     def projected_scores_read(self, update=False, align_team_names=True):
-        fte = fivethirtyeight.FiveThirtyEight()
-        fte.read_data(update=update)
-        fte.data = fte.data[fte.data['date'] >= '2019-08-15']
-        df = fte.data.loc[:, ('team1', 'team2', 'proj_score1', 'proj_score2')]
+        """ Reads the projected scores and the final scores (NaN for matches not played yet) of self.season.
+
+        Only one season is kept: a fixture is unique within a season, and the season is the key of the fixtures in the
+        store and the archive. If self.season is None, the latest season of the data is used and stored in self.season.
+        """
+        fte = fivethirtyeight.FiveThirtyEight(self.instrumentation)
+        # float64 projected scores (not compact); the other seasons are dropped while reading
+        fte.read_data(update=update, min_date=None, season=self.season if self.season is not None else 'latest')
+        if self.season is None and len(fte.data):
+            self.season = int(fte.data['season'].max())
+        df = fte.data.loc[:, ('team1', 'team2', 'proj_score1', 'proj_score2', 'score1', 'score2')]
 
         if align_team_names:
             df = self.align_team_names_in_df(df)
         return df
 
     def projected_scores_update(self):
-        self.projected_scores = self.projected_scores_read(update=True)
+        """ Downloads the projected scores again.
+
+        The fixtures whose projected scores moved are stored in self.projected_scores_changed and, if self.store is
+        set, only these are added to the store. Predictions of unchanged fixtures are not recomputed. New final scores
+        are added to the results of the store.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Projected scores of new fixtures and fixtures whose projected scores changed
+        """
+        projected_scores = self.projected_scores_read(update=True)
+        self.projected_scores_changed = self.projected_scores_changes(self.projected_scores, projected_scores)
+        self.projected_scores = projected_scores
+
+        if self.store is not None and len(self.projected_scores_changed):
+            changed = self.projected_scores_changed
+            self.store.add_projections(changed, self.season)
+            self._stored_projections.update(self._fixture_lambdas(changed))
+        if self.store is not None:
+            self._store_results(self.projected_scores)
+        return self.projected_scores_changed
+
+    @staticmethod
+    def projected_scores_changes(old, new, tol=1e-6):
+        """ Returns the rows of new whose fixture is not in old or whose projected scores differ by more than tol
+
+        Parameters
+        ----------
+        old, new : pandas.DataFrame
+            Projected scores with columns 'team1', 'team2', 'proj_score1', 'proj_score2'
+        tol : float
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows of new, with the additional columns 'delta1' and 'delta2' (change of the projected scores, NaN for new
+            fixtures)
+        """
+        keys = ['team1', 'team2']
+        previous = old.drop_duplicates(keys)[keys + ['proj_score1', 'proj_score2']]
+        df = new.merge(previous, on=keys, how='left', suffixes=('', '_old'))
+        df['delta1'] = df['proj_score1'] - df['proj_score1_old']
+        df['delta2'] = df['proj_score2'] - df['proj_score2_old']
+        moved = ~((df['delta1'].abs() <= tol) & (df['delta2'].abs() <= tol))  # NaN (new fixtures) counts as moved
+        return df.loc[moved.values, list(new.columns) + ['delta1', 'delta2']].reset_index(drop=True)
+
+    def _store_results(self, df):
+        """ Adds the final scores in df (columns 'team1', 'team2', 'score1', 'score2') which are not stored yet """
+        played = df[df[['score1', 'score2']].notna().all(axis=1).values]
+        scores = list(zip(zip(played['team1'].astype(str), played['team2'].astype(str)),
+                          zip(played['score1'].astype(int), played['score2'].astype(int))))
+        new = [self._stored_results.get(fixture) != score for fixture, score in scores]
+        if any(new):
+            self.store.add_results(played[new], self.season)
+            self._stored_results.update(fs for fs, n in zip(scores, new) if n)
+
+    @staticmethod
+    def _fixture_lambdas(df):
+        """ Returns the pairs ((team1, team2), (l1, l2)) of the projected scores in df """
+        fixtures = zip(df['team1'].astype(str), df['team2'].astype(str))
+        lambdas = zip(df['proj_score1'].astype(float), df['proj_score2'].astype(float))
+        return list(zip(fixtures, lambdas))
 
     def kicktipp_matches_read(self, matchday=None, align_team_names=True):
         df = self._kicktipp_api.read_games(matchday)
@@ -77,44 +173,91 @@ class TipperBundesliga:
 
     def projected_scores_for_matchday(self, matchday=None):
         df_matchday = self.kicktipp_matches_read(matchday=matchday)
-        proj_score1 = []
-        proj_score2 = []
-        for _, row in df_matchday.iterrows():
-            ps1, ps2 = self.projected_scores_for_match(row['team1'], row['team2'])
-            proj_score1.append(ps1)
-            proj_score2.append(ps2)
+
+        # join on the team codes shared by the league table and the projected scores
+        keys = ['team1', 'team2']
+        fixtures = df_matchday[keys].astype(self.team_dtype)
+        projected_scores = self.projected_scores[keys + ['proj_score1', 'proj_score2']].drop_duplicates(keys)
+        df = fixtures.merge(projected_scores.astype({'team1': self.team_dtype, 'team2': self.team_dtype}),
+                            on=keys, how='left')
 
         df_ps = pd.DataFrame(
             {'team1': df_matchday['team1'], 'team2': df_matchday['team2'],
-             'proj_score1': proj_score1, 'proj_score2': proj_score2})
+             'proj_score1': df['proj_score1'].values.astype(float),
+             'proj_score2': df['proj_score2'].values.astype(float)},
+            index=df_matchday.index)
+
+        missing = df_ps[df_ps[['proj_score1', 'proj_score2']].isna().any(axis=1)]
+        if len(missing):
+            warnings.warn('No projected scores for ' + ', '.join(
+                '{} - {}'.format(team1, team2) for team1, team2 in zip(missing['team1'], missing['team2'])) +
+                ', these matches are not predicted.', UserWarning)
 
         return df_ps
 
+    def projected_scores_from_odds_for_matchday(self, matchday=None, method='proportional'):
+        """ Projected scores implied by the bookmaker's odds shown on the kicktipp website.
+
+        Parameters
+        ----------
+        matchday : int, optional
+            Number of matchday. If None (default), the upcoming matchday is used.
+        method : str
+            Method to remove the overround, see odds.remove_overround
+
+        Returns
+        -------
+        pandas.DataFrame
+            Same format as projected_scores_for_matchday. Matches without odds have no projected scores (NaN).
+        """
+        df_matchday = self.kicktipp_matches_read(matchday=matchday)
+        match_odds = df_matchday[['odds_win1', 'odds_draw', 'odds_win2']].astype(float).values
+        has_odds = ~np.isnan(match_odds).any(axis=1)
+
+        proj_score1 = np.full(len(df_matchday), np.nan)
+        proj_score2 = np.full(len(df_matchday), np.nan)
+        if has_odds.any():
+            proj_score1[has_odds], proj_score2[has_odds] = odds.lambdas_from_odds(match_odds[has_odds], method)
+
+        return pd.DataFrame({'team1': df_matchday['team1'], 'team2': df_matchday['team2'],
+                             'proj_score1': proj_score1, 'proj_score2': proj_score2})
+
+    @instr.instrumented('tipper.predict')
     def predicted_scores_for_matchday(self, matchday=None):
+        """ Predicted scores and tendency probabilities of a matchday.
+
+        Matches without projected scores (see projected_scores_for_matchday) are not predicted, their predicted scores
+        and probabilities are NaN.
+        """
         df_ps = self.projected_scores_for_matchday(matchday=matchday)
+        self._update_predictions(df_ps)
 
-        pred_score1 = []
-        pred_score2 = []
-        prob1 = []
-        prob2 = []
-        prob_draw = []
-
-        for _, row in df_ps.iterrows():
-            self._pred.l1 = row['proj_score1']
-            self._pred.l2 = row['proj_score2']
-            pred_score1.append(self._pred.predicted_score[0][0])
-            pred_score2.append(self._pred.predicted_score[0][1])
-            prob1.append(self._pred.probs_tendency[0])
-            prob2.append(self._pred.probs_tendency[1])
-            prob_draw.append(self._pred.probs_tendency[2])
-
-        df_ps['pred_score1'] = pred_score1
-        df_ps['pred_score2'] = pred_score2
-        df_ps['prob1'] = prob1
-        df_ps['prob2'] = prob2
-        df_ps['prob_draw'] = prob_draw
-        return df_ps
+        columns = ['pred_score1', 'pred_score2', 'prob1', 'prob2', 'prob_draw']
+        not_predicted = (np.nan,)*len(columns)
+        predictions = [self._predictions[fixture][2] if fixture in self._predictions else not_predicted
+                       for fixture in zip(df_ps['team1'], df_ps['team2'])]
+        return df_ps.join(pd.DataFrame(predictions, columns=columns, index=df_ps.index))
+
+    def _update_predictions(self, df_ps):
+        """ Computes the predictions of all fixtures in df_ps which are not cached with the same projected scores.
+        Fixtures without projected scores are removed from the cache and not predicted.
+        """
+        fixtures = list(zip(df_ps['team1'], df_ps['team2']))
+        l1 = df_ps['proj_score1'].values.astype(float)
+        l2 = df_ps['proj_score2'].values.astype(float)
+        projected = np.isfinite(l1) & np.isfinite(l2)
+        for k in np.flatnonzero(~projected):
+            self._predictions.pop(fixtures[k], None)
+        outdated = [k for k, fixture in enumerate(fixtures)
+                    if projected[k] and self._predictions.get(fixture, (None, None))[:2] != (l1[k], l2[k])]
+        if not outdated:
+            return
 
+        scores, _, tendency = self._pred.predict_batch(l1[outdated], l2[outdated])
+        for k, score, probs in zip(outdated, scores.tolist(), tendency.tolist()):
+            self._predictions[fixtures[k]] = (l1[k], l2[k], (score[0], score[1], probs[0], probs[1], probs[2]))
+
+    @instr.instrumented('tipper.predict_and_submit')
     def predict_and_submit_scores_for_matchday(self, matchday: Union[int, list] = None):
         """
         Predict scores for a matchday and submit these scores the Kicktipp website.
@@ -129,28 +272,69 @@ class TipperBundesliga:
             matchday = [matchday]  # matchday is not a list, so convert it to one
         for md in matchday:
             df_pred_scores = self.predicted_scores_for_matchday(matchday=md)
-            scores = [df_pred_scores['pred_score1'].tolist(), df_pred_scores['pred_score2'].tolist()]
-            scores = list(map(list, zip(*scores)))  # transpose list of lists
-            # see https://stackoverflow.com/questions/6473679/transpose-list-of-lists/6473727
-            self._kicktipp_api.submit_predictions(scores=scores, matchday=md)
+            # matches without prediction (no projected scores) are submitted as None, so their tipps are not changed
+            predicted = df_pred_scores[['pred_score1', 'pred_score2']].notna().all(axis=1).values
+            scores = [[int(s1), int(s2)] if p else None for s1, s2, p in
+                      zip(df_pred_scores['pred_score1'], df_pred_scores['pred_score2'], predicted)]
+            # the tippabgabe page was just read for the prediction, so it is not fetched again
+            submitted = self._kicktipp_api.submit_predictions(scores=scores, matchday=md, refresh=False)
 
-    def store_data_for_matchday_to_file(self, matchday=None, filename=None, overwrite=False):
+            if submitted and self.store is not None:
+                df_tips = df_pred_scores[predicted].rename(columns={'pred_score1': 'tipp1', 'pred_score2': 'tipp2'})
+                self.store.add_tips(self.kicktipp_group, df_tips, self.season)
+
+    def member_tips_for_matchday(self, matchday):
+        """ Reads the tipps of all members of the group for a matchday (one request, see
+        KicktippAPI.read_all_predictions). If self.store is set, the tipps are added to the store.
+
+        Parameters
+        ----------
+        matchday : int
+            Number of matchday
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            Columns: member_id, member_name, team1, team2, tipp1, tipp2. None if the overview page could not be read.
+        """
+        df = self._kicktipp_api.read_all_predictions(matchday)
+        if df is None:
+            return None
+        df = self.align_team_names_in_df(df)
+        if self.store is not None:
+            self.store.add_member_tips(self.kicktipp_group, df, self.season)
+        return df
+
+    def matchday_snapshot(self, matchday=None):
+        """ Returns the matches of a matchday with points, odds, projected and predicted scores and the current time.
+
+        Parameters
+        ----------
+        matchday : int, optional
+            Number of matchday. If None (default), the upcoming matchday is used.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
         df = self.kicktipp_matches_read(matchday=matchday)
         df_proj_score = self.projected_scores_for_matchday(matchday=matchday)
         df_pred_score = self.predicted_scores_for_matchday(matchday=matchday)
-        df = df.drop('date', 1)
+        df = df.drop(columns='date')
         df['proj_score1'] = df_proj_score['proj_score1']
         df['proj_score2'] = df_proj_score['proj_score2']
         df['pred_score1'] = df_pred_score['pred_score1']
         df['pred_score2'] = df_pred_score['pred_score2']
-        dt = datetime.now()
-        dtstr = dt.strftime('%Y-%m-%d %H:%M:%S')
-        dtstr2 = dt.strftime('%Y-%m-%d_%H-%M-%S')
+        df['timestamp'] = [datetime.now().strftime('%Y-%m-%d %H:%M:%S')]*len(df.index)
+
+        return df
 
-        df['timestamp'] = [dtstr]*len(df.index)
+    def store_data_for_matchday_to_file(self, matchday=None, filename=None, overwrite=False):
+        df = self.matchday_snapshot(matchday=matchday)
 
         if filename is None:
             md = df['matchday'][0]
+            dtstr2 = datetime.strptime(df['timestamp'][0], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d_%H-%M-%S')
             filename = os.path.join(self._datapath, 'matchday' + str(md).zfill(2) + '_' + dtstr2 + '.csv')
         else:
             filename = os.path.join(self._datapath, filename)
@@ -159,3 +343,58 @@ class TipperBundesliga:
             return
         else:
             df.to_csv(filename, index=False)
+
+    def store_report_for_matchday(self, matchday=None, report=None):
+        """ Renders the report of a matchday (see report.MatchdayReport)
+
+        Parameters
+        ----------
+        matchday : int, optional
+            Number of matchday. If None (default), the upcoming matchday is used.
+        report : report.MatchdayReport, optional
+            If None (default), a report in the data directory is used, which computes the score probabilities with the
+            predictor of the tipps.
+
+        Returns
+        -------
+        str
+            Filename of the HTML page
+        """
+        if report is None:
+            report = reporting.MatchdayReport(os.path.join(self._datapath, 'reports'), predictor=self._pred)
+        df = self.predicted_scores_for_matchday(matchday=matchday)
+        df = df[df[['pred_score1', 'pred_score2']].notna().all(axis=1).values]  # matches without prediction
+        md = 'next' if matchday is None else str(matchday).zfill(2)
+        return report.render(df, name=self.kicktipp_group + '_matchday' + md)
+
+    def store_data_for_matchday_to_archive(self, matchday=None):
+        """ Appends a snapshot of a matchday (see matchday_snapshot) to self.archive """
+        self.archive.append(self.matchday_snapshot(matchday=matchday), self.season)
+
+    def store_data_for_matchday_to_db(self, matchday=None, timestamp=None):
+        """ Stores the fixtures, projected scores and predicted scores of a matchday in self.store
+
+        Parameters
+        ----------
+        matchday : int, optional
+            Number of matchday. If None (default), the upcoming matchday is stored.
+        timestamp : str or datetime.datetime, optional
+            Timestamp of the projections and predictions. If None (default), the current time is used.
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+        df = self.kicktipp_matches_read(matchday=matchday)
+        df_pred_score = self.predicted_scores_for_matchday(matchday=matchday)
+        df_pred_score = df_pred_score[df_pred_score[['pred_score1', 'pred_score2']].notna().all(axis=1).values]
+
+        self.store.add_fixtures(df, self.season)
+
+        # projections and predictions are only added for fixtures whose projected scores changed since they were last
+        # stored (projections are also stored by projected_scores_update)
+        fixture_lambdas = self._fixture_lambdas(df_pred_score)
+        for stored, add in ((self._stored_projections, self.store.add_projections),
+                            (self._stored_predictions, self.store.add_predictions)):
+            changed = [stored.get(fixture) != l for fixture, l in fixture_lambdas]
+            if any(changed):
+                add(df_pred_score[changed], self.season, timestamp=timestamp)
+                stored.update(fl for fl, c in zip(fixture_lambdas, changed) if c)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+from collections import Counter
 from difflib import SequenceMatcher
+import unicodedata
 
 """ This file contains some helper tools.
 
@@ -17,3 +19,109 @@ def similar(a, b):
     similar("Apple","Mango") => 0.0
     """
     return SequenceMatcher(None, a, b).ratio()
+
+
+def quote_identifier(name):
+    """ Quotes an SQL identifier (e.g. a table name), so it can be safely inserted into a SQL statement.
+
+    Example:
+    quote_identifier('Bundesliga') => '"Bundesliga"'
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class NameMatcher:
+    """ Finds the most similar name in a (large) set of names, e.g. to map the team names of kicktipp to those of
+    FiveThirtyEight.
+
+    The names are normalized (lower case, without accents and punctuation) and indexed by their character n-grams.
+    A query only looks at the names sharing n-grams with it: the max_candidates names with the highest n-gram overlap
+    (Dice coefficient) are compared with similar(), the best one is returned. So the cost of a query depends on the
+    number of names sharing n-grams, not on the number of all names. Only if no name shares an n-gram, all names
+    are compared.
+
+    Example:
+    matcher = NameMatcher(['Bayern Munich', 'Borussia Dortmund'])
+    matcher.match('FC Bayern München') => ('Bayern Munich', 0.8)
+    """
+
+    def __init__(self, names=(), n=3, max_candidates=20, cutoff=0.0):
+        """
+        :param names: Names to index
+        :param int n: Length of the n-grams, defaults to 3 (trigrams)
+        :param int max_candidates: Number of names compared with similar() per query
+        :param float cutoff: Minimum similarity of a match. If the best match is below, match returns (None, score).
+        """
+        self.n = n
+        self.max_candidates = max_candidates
+        self.cutoff = cutoff
+
+        self._names = []  # original names
+        self._normalized = []
+        self._ngram_counts = []  # number of distinct n-grams of each name
+        self._index = {}  # n-gram => list of positions in self._names
+        self._positions = {}  # name => position in self._names
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def normalize(name):
+        """ Returns the name in lower case, without accents and punctuation and with single spaces
+
+        Example:
+        normalize("Borussia M'gladbach") => 'borussia mgladbach'
+        """
+        name = unicodedata.normalize('NFKD', str(name)).replace('ß', 'ss')
+        name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+        name = ''.join(c if c.isalnum() or c.isspace() else '' for c in name)
+        return ' '.join(name.split())
+
+    def ngrams(self, name):
+        """ Returns the set of character n-grams of a normalized name, padded with spaces """
+        padded = ' ' + name + ' '
+        return {padded[k:k + self.n] for k in range(max(len(padded) - self.n + 1, 1))}
+
+    def add(self, name):
+        """ Adds a name to the index (names already in the index are ignored) """
+        if name in self._positions:
+            return
+        position = len(self._names)
+        normalized = self.normalize(name)
+        ngrams = self.ngrams(normalized)
+        self._positions[name] = position
+        self._names.append(name)
+        self._normalized.append(normalized)
+        self._ngram_counts.append(len(ngrams))
+        for ngram in ngrams:
+            self._index.setdefault(ngram, []).append(position)
+
+    def candidates(self, name):
+        """ Returns the positions of the names with the highest n-gram overlap (at most max_candidates) """
+        ngrams = self.ngrams(self.normalize(name))
+        shared = Counter(position for ngram in ngrams for position in self._index.get(ngram, ()))
+        dice = {position: 2*count/(len(ngrams) + self._ngram_counts[position]) for position, count in shared.items()}
+        return sorted(dice, key=dice.get, reverse=True)[:self.max_candidates]
+
+    def match(self, name):
+        """ Returns the most similar name and its similarity
+
+        :param string name: Query
+        :return: (name, similarity). name is None if no name is indexed or the similarity is below cutoff.
+        """
+        if name in self._positions:
+            return name, 1.0
+
+        normalized = self.normalize(name)
+        positions = self.candidates(name) or range(len(self._names))
+        best, p_max = None, 0.0
+        for position in positions:
+            p = similar(normalized, self._normalized[position])
+            if best is None or p > p_max:
+                best, p_max = position, p
+
+        if best is None or p_max < self.cutoff:
+            return None, p_max
+        return self._names[best], p_max
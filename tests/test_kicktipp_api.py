@@ -0,0 +1,50 @@
+""" The markup in these tests is hand-written after the format the parsers expect. It is not captured from the live
+kicktipp site, so the tests pin the assumed format: if kicktipp changes its pages, update the markup and the parsers.
+"""
+from bs4 import BeautifulSoup
+
+from kicktipper.kicktipp_api import KicktippAPI
+
+TIPPUEBERSICHT = '''
+<table>
+<tr><td class="nw kicktipp-time">18.10.19 20:30</td><td class="nw">Bayern</td><td class="nw">Dortmund</td>
+    <td class="nw">-:-</td></tr>
+<tr><td class="nw kicktipp-time">19.10.19 15:30</td><td class="nw">Freiburg</td><td class="nw">Köln</td>
+    <td class="nw">-:-</td></tr>
+</table>
+<table>
+<tr class="teilnehmer" data-teilnehmer-id="11"><td class="name">Anna</td>
+    <td class="ereignis ereignis0">2:1<sub>4</sub></td><td class="ereignis ereignis1">0:0</td></tr>
+<tr class="teilnehmer" data-teilnehmer-id="12"><td class="name">Ben</td>
+    <td class="ereignis ereignis0">1:3</td><td class="ereignis ereignis1"></td></tr>
+</table>
+'''
+
+GESAMTUEBERSICHT = '''
+<a href="gesamtuebersicht?spieltagIndex=5">5</a>
+<div class="pagination">
+<a href="gesamtuebersicht?teilnehmerSeite=1">1</a>
+<a href="gesamtuebersicht?teilnehmerSeite=2">2</a>
+<a href="gesamtuebersicht?teilnehmerSeite=3">3</a>
+<a href="gesamtuebersicht?teilnehmerSeite=2">&gt;</a>
+</div>
+<a href="gesamtuebersicht?teilnehmerSeite=9">9</a>
+'''
+
+
+def test_parse_tippuebersicht():
+    df = KicktippAPI._parse_tippuebersicht(BeautifulSoup(TIPPUEBERSICHT, 'html5lib'))
+
+    assert df.iloc[:3].values.tolist() == [[11, 'Anna', 'Bayern', 'Dortmund', 2, 1],
+                                           [11, 'Anna', 'Freiburg', 'Köln', 0, 0],
+                                           [12, 'Ben', 'Bayern', 'Dortmund', 1, 3]]
+    # no tipp (or hidden tipp)
+    assert df.iloc[3][['member_id', 'team1', 'team2']].tolist() == [12, 'Freiburg', 'Köln']
+    assert df.iloc[3][['tipp1', 'tipp2']].isna().all()
+
+
+def test_member_page_urls():
+    url = 'https://www.kicktipp.de/group/gesamtuebersicht'
+    urls = KicktippAPI._member_page_urls(BeautifulSoup(GESAMTUEBERSICHT, 'html5lib'), url)
+
+    assert urls == [url + '?teilnehmerSeite=2', url + '?teilnehmerSeite=3']
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from kicktipper.predictor import MatchPredictor, TIE_BREAKS
+
+
+@pytest.mark.parametrize('tie_break', TIE_BREAKS)
+def test_predicted_score_batch_matches_scalar_for_symmetric_lambdas(tie_break):
+    """ For l1 == l2 the tendencies team 1 wins and team 2 wins are tied; both paths must break the tie the same way """
+    l = np.linspace(0.2, 3.4, 200)
+    pred = MatchPredictor()
+    scores, _ = pred.predicted_score_batch(pred.calculate_score_probs_batch(l, l), tie_break)
+
+    for l_k, score in zip(l, scores):
+        expected, _ = MatchPredictor(l_k, l_k, tie_break=tie_break).predicted_score
+        assert [int(s) for s in expected] == score.tolist(), l_k
+
+
+def test_predicted_score_batch_matches_scalar():
+    rng = np.random.default_rng(0)
+    l1 = rng.uniform(0.2, 3.5, 300)
+    l2 = rng.uniform(0.2, 3.5, 300)
+    pred = MatchPredictor()
+    scores, _ = pred.predicted_score_batch(pred.calculate_score_probs_batch(l1, l2))
+
+    for l1_k, l2_k, score in zip(l1, l2, scores):
+        expected, _ = MatchPredictor(l1_k, l2_k).predicted_score
+        assert [int(s) for s in expected] == score.tolist(), (l1_k, l2_k)